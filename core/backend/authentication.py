@@ -0,0 +1,29 @@
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from backend.cache import AUTH_TOKEN_TTL, auth_token_key
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication, который держит пару (token, user) в кэше,
+    чтобы не делать SELECT по authtoken_token + user на каждый запрос.
+    Кэш сбрасывается сигналами при сохранении пользователя и удалении токена.
+    """
+
+    def authenticate_credentials(self, key):
+        cache_key = auth_token_key(key)
+        token = cache.get(cache_key)
+        if token is None:
+            model = self.get_model()
+            try:
+                token = model.objects.select_related("user").get(key=key)
+            except model.DoesNotExist:
+                raise AuthenticationFailed("Invalid token.")
+            cache.set(cache_key, token, AUTH_TOKEN_TTL)
+
+        if not token.user.is_active:
+            raise AuthenticationFailed("User inactive or deleted.")
+
+        return (token.user, token)
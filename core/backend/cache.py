@@ -0,0 +1,123 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.authtoken.models import Token
+
+from backend.models import Address, Shop
+
+DEFAULT_ADDRESS_TTL = 300
+AUTH_TOKEN_TTL = 300
+CATALOG_TTL = 60
+SHOP_PROFILE_TTL = 300
+SHOP_ID_TTL = 3600
+
+# Маркер "у пользователя нет адреса по умолчанию", чтобы не ходить в БД повторно
+_NO_ADDRESS = "none"
+# То же для "у пользователя нет магазина" (pk магазина не бывает 0)
+_NO_SHOP = 0
+
+
+def _default_address_key(user_id: int) -> str:
+    return f"defaddr:{user_id}"
+
+
+def get_default_address(user) -> Address | None:
+    """
+    Адрес по умолчанию пользователя (через кэш).
+    Кэш сбрасывается при любом изменении адресов — см. invalidate_default_address.
+    """
+    key = _default_address_key(user.id)
+    addr = cache.get(key)
+    if addr is None:
+        addr = Address.objects.filter(user=user, is_default=True).first()
+        cache.set(key, addr or _NO_ADDRESS, DEFAULT_ADDRESS_TTL)
+        return addr
+    return None if addr == _NO_ADDRESS else addr
+
+
+def invalidate_default_address(user_id: int) -> None:
+    # Сбрасываем после коммита, иначе параллельный запрос успеет закэшировать старое значение
+    transaction.on_commit(lambda: cache.delete(_default_address_key(user_id)))
+
+
+def auth_token_key(key: str) -> str:
+    return f"authtoken:{key}"
+
+
+def _drop_user_tokens(user_id: int) -> None:
+    keys = Token.objects.filter(user_id=user_id).values_list("key", flat=True)
+    cache.delete_many([auth_token_key(key) for key in keys])
+
+
+def invalidate_user_tokens(user_id: int) -> None:
+    # В кэше токена лежит и сам пользователь — после смены его данных запись устаревает.
+    # Сбрасываем после коммита, как и остальные кэши
+    transaction.on_commit(lambda: _drop_user_tokens(user_id))
+
+
+_CATALOG_VERSION_KEY = "catalog:version"
+
+
+def _catalog_version() -> int:
+    version = cache.get(_CATALOG_VERSION_KEY)
+    if version is None:
+        # Версия по времени: после вытеснения ключа старые записи не оживут.
+        # add мог проиграть гонку параллельному запросу — берём то значение, что реально записано
+        version = time.time_ns()
+        if not cache.add(_CATALOG_VERSION_KEY, version, None):
+            version = cache.get(_CATALOG_VERSION_KEY, version)
+    return version
+
+
+def catalog_cache_key(path: str) -> str:
+    """
+    Ключ кэша публичного каталога для конкретного URL (с фильтрами и сортировкой).
+    В ключ входит версия каталога — см. invalidate_catalog.
+    """
+    return f"catalog:{_catalog_version()}:{path}"
+
+
+def _bump_catalog_version() -> None:
+    try:
+        cache.incr(_CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.set(_CATALOG_VERSION_KEY, time.time_ns(), None)
+
+
+def invalidate_catalog() -> None:
+    # delete по шаблону встроенный RedisCache не умеет, поэтому меняем версию:
+    # все старые ключи разом перестают читаться и доживают свой TTL
+    transaction.on_commit(_bump_catalog_version)
+
+
+def shop_profile_key(shop_id: int) -> str:
+    return f"shopme:{shop_id}"
+
+
+def invalidate_shop_profiles(shop_ids) -> None:
+    # Профиль магазина (поля + названия категорий) сбрасывается после коммита, как и адрес по умолчанию
+    keys = [shop_profile_key(shop_id) for shop_id in shop_ids]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def _shop_id_key(user_id: int) -> str:
+    return f"shopid:{user_id}"
+
+
+def get_shop_id(user_id: int) -> int | None:
+    """
+    ID магазина пользователя (через кэш).
+    Владелец магазина меняется только при создании/удалении/переназначении — см. invalidate_shop_id.
+    """
+    key = _shop_id_key(user_id)
+    shop_id = cache.get(key)
+    if shop_id is None:
+        shop_id = Shop.objects.filter(user_id=user_id).values_list("id", flat=True).first()
+        cache.set(key, shop_id or _NO_SHOP, SHOP_ID_TTL)
+    return shop_id or None
+
+
+def invalidate_shop_id(user_id: int) -> None:
+    transaction.on_commit(lambda: cache.delete(_shop_id_key(user_id)))
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.9 on 2026-10-15 12:30
+
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+
+
+def fill_order_totals(apps, schema_editor):
+    Order = apps.get_model("backend", "Order")
+    ShopOrder = apps.get_model("backend", "ShopOrder")
+    OrderItem = apps.get_model("backend", "OrderItem")
+
+    for order in Order.objects.all().only("id"):
+        agg = OrderItem.objects.filter(shop_order__order_id=order.id).aggregate(
+            total=Sum(F("quantity") * F("price_at_purchase")),
+            items_count=Count("id"),
+        )
+        Order.objects.filter(id=order.id).update(
+            total_cached=agg["total"] or 0,
+            items_count_cached=agg["items_count"],
+            shops_count_cached=ShopOrder.objects.filter(order_id=order.id).count(),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0004_order_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='items_count_cached',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество позиций'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='shops_count_cached',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество магазинов'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_cached',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Сумма заказа'),
+        ),
+        migrations.RunPython(fill_order_totals, migrations.RunPython.noop),
+    ]
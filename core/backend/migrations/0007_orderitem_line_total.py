@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-15 13:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0006_user_email_lower_uniq'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='line_total',
+            field=models.GeneratedField(db_persist=True, expression=models.F('quantity') * models.F('price_at_purchase'), output_field=models.DecimalField(decimal_places=2, max_digits=12)),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.9 on 2026-10-15 18:10
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Min
+
+
+def fill_shop_offers(apps, schema_editor):
+    Shop = apps.get_model("backend", "Shop")
+    ProductInfo = apps.get_model("backend", "ProductInfo")
+
+    for shop in Shop.objects.all().only("id"):
+        agg = ProductInfo.objects.filter(shop_id=shop.id).aggregate(
+            offers_count=Count("id"),
+            min_price=Min("price"),
+            max_price=Max("price"),
+        )
+        Shop.objects.filter(id=shop.id).update(
+            offers_count_cached=agg["offers_count"],
+            min_price_cached=agg["min_price"],
+            max_price_cached=agg["max_price"],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0008_order_user_status_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='max_price_cached',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='Максимальная цена'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='min_price_cached',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='Минимальная цена'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='offers_count_cached',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество офферов'),
+        ),
+        migrations.RunPython(fill_shop_offers, migrations.RunPython.noop),
+    ]
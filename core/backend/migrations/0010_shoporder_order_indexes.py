@@ -0,0 +1,21 @@
+# Generated by Django 5.2.9 on 2026-10-15 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0009_shop_offers_cached'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['-date'], name='order_date_desc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shoporder',
+            index=models.Index(fields=['shop', 'status', 'order'], name='so_shop_status_order_idx'),
+        ),
+    ]
@@ -1,7 +1,8 @@
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 from django.db import models
-from django.db.models import UniqueConstraint, Q
+from django.db.models import UniqueConstraint, Q, F
+from django.db.models.functions import Lower
 from django.utils import timezone
 from django.contrib.auth.base_user import BaseUserManager
 from django.contrib.auth.validators import UnicodeUsernameValidator
@@ -76,6 +77,9 @@ class User(AbstractUser):
         verbose_name = "Пользователь"
         verbose_name_plural = "Пользователи"
         ordering = ("email",)
+        constraints = [
+            UniqueConstraint(Lower("email"), name="user_email_lower_uniq"),
+        ]
 
 
 class Shop(models.Model):
@@ -93,6 +97,11 @@ class Shop(models.Model):
 
     state = models.BooleanField(default=True, verbose_name="Статус получения заказов")
 
+    # Денормализованные агрегаты по офферам для публичного профиля, пересчитываются сигналами ProductInfo
+    offers_count_cached = models.PositiveIntegerField(default=0, verbose_name="Количество офферов")
+    min_price_cached = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, verbose_name="Минимальная цена")
+    max_price_cached = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, verbose_name="Максимальная цена")
+
     def __str__(self) -> str:
         return self.name
 
@@ -195,6 +204,13 @@ class Order(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="orders", verbose_name="Заказчик")
     date = models.DateTimeField(default=timezone.now, verbose_name="Дата заказа")
     status = models.CharField(choices=Status.choices, default=Status.BASKET, max_length=10, verbose_name="Статус заказа")
+    # Меняется при любом изменении корзины/заказа — используется как версия для кэша корзины
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата изменения")
+
+    # Денормализованные агрегаты для списка заказов, фиксируются при оформлении (CheckoutAPIView)
+    total_cached = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Сумма заказа")
+    shops_count_cached = models.PositiveIntegerField(default=0, verbose_name="Количество магазинов")
+    items_count_cached = models.PositiveIntegerField(default=0, verbose_name="Количество позиций")
 
     shipping_country = models.CharField(max_length=50, blank=True, default="", verbose_name="Страна")
     shipping_city = models.CharField(max_length=50, blank=True, default="", verbose_name="Город")
@@ -209,6 +225,11 @@ class Order(models.Model):
         verbose_name = "Заказ"
         verbose_name_plural = "Заказы"
         ordering = ("-date",)
+        indexes = [
+            models.Index(fields=["user", "status"], name="order_user_status_idx"),
+            # заказы магазина отдаются от новых к старым (GetOrdersAPIView)
+            models.Index(fields=["-date"], name="order_date_desc_idx"),
+        ]
         constraints = [
             UniqueConstraint(
                 fields=["user"],
@@ -236,6 +257,10 @@ class ShopOrder(models.Model):
         verbose_name = "Подзаказ магазина"
         verbose_name_plural = "Подзаказы магазина"
         ordering = ("order_id",)
+        indexes = [
+            # список заказов продавца: фильтр по магазину и статусу, JOIN к заказу по order_id
+            models.Index(fields=["shop", "status", "order"], name="so_shop_status_order_idx"),
+        ]
         constraints = [
             UniqueConstraint(fields=["order", "shop"], name="uniq_order_shop"),
         ]
@@ -250,6 +275,12 @@ class OrderItem(models.Model):
 
     quantity = models.PositiveIntegerField()
     price_at_purchase = models.DecimalField(max_digits=10, decimal_places=2)
+    # Сумма позиции считается самой БД (STORED-колонка), по ней удобно агрегировать
+    line_total = models.GeneratedField(
+        expression=F("quantity") * F("price_at_purchase"),
+        output_field=models.DecimalField(max_digits=12, decimal_places=2),
+        db_persist=True,
+    )
 
     class Meta:
         verbose_name = "Позиция в заказе"
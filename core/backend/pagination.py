@@ -0,0 +1,21 @@
+from drf_spectacular.utils import inline_serializer
+from rest_framework import serializers
+from rest_framework.pagination import LimitOffsetPagination
+
+
+class DefaultLimitOffsetPagination(LimitOffsetPagination):
+    default_limit = 20
+    max_limit = 100
+
+
+def paginated_schema(name: str, results_serializer) -> serializers.Serializer:
+    # Обёртка limit/offset для extend_schema: APIView с ручной пагинацией spectacular сам не оборачивает
+    return inline_serializer(
+        name=name,
+        fields={
+            "count": serializers.IntegerField(),
+            "next": serializers.URLField(allow_null=True),
+            "previous": serializers.URLField(allow_null=True),
+            "results": results_serializer,
+        },
+    )
@@ -0,0 +1,9 @@
+from rest_framework.permissions import BasePermission
+
+
+# Эндпоинты продавца: проверка типа пользователя до запуска обработчика
+class IsShopOwner(BasePermission):
+    message = "Это действие доступно только владельцу магазина."
+
+    def has_permission(self, request, view):
+        return request.user.type == "shop"
@@ -0,0 +1,22 @@
+import orjson
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+# Типы, которых orjson не знает (Decimal, ленивые строки переводов и т.п.), отдаём стандартному энкодеру DRF
+_DRF_DEFAULT = JSONEncoder().default
+
+
+def orjson_dumps(data) -> bytes:
+    return orjson.dumps(data, default=_DRF_DEFAULT, option=orjson.OPT_NON_STR_KEYS)
+
+
+# JSON-рендерер на orjson для тяжёлых списков: кодирование в разы быстрее stdlib json
+class ORJSONRenderer(BaseRenderer):
+    media_type = "application/json"
+    format = "json"
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return orjson_dumps(data)
@@ -84,7 +84,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
         )
 
     def get_line_total(self, obj):
-        return obj.price_at_purchase * obj.quantity
+        return obj.line_total
 
 
 class ShopOrderCartSerializer(serializers.ModelSerializer):
@@ -121,7 +121,7 @@ class BasketSerializer(serializers.ModelSerializer):
         # obj.shop_orders и items обычно уже подтянуты, но даже если нет — ок.
         for so in obj.shop_orders.all():
             for item in so.items.all():
-                total += item.price_at_purchase * item.quantity
+                total += item.line_total
         return total
 
 
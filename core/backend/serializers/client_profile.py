@@ -1,7 +1,8 @@
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
+from django.db.models import Prefetch
+from django.db.models.functions import Lower
 from rest_framework import serializers
-from rest_framework.validators import UniqueValidator
 
 from backend.models import Address, Order, ShopOrder, OrderItem
 
@@ -47,12 +48,13 @@ class ChangePasswordSerializer(serializers.Serializer):
 
 
 class RequestEmailChangeSerializer(serializers.Serializer):
-    new_email = serializers.EmailField(
-        validators=[UniqueValidator(queryset=User.objects.all())]
-    )
+    new_email = serializers.EmailField()
 
     def validate_new_email(self, value):
         value = value.strip().lower()
+        # Без учёта регистра, как и при подтверждении: lower(email) попадает в индекс user_email_lower_uniq
+        if User.objects.annotate(email_lower=Lower("email")).filter(email_lower=value).exists():
+            raise serializers.ValidationError("Пользователь с таким email уже существует.")
         return value
 
 
@@ -137,6 +139,18 @@ class ClientShopOrderSerializer(serializers.ModelSerializer):
 class ClientOrderDetailSerializer(serializers.ModelSerializer):
     shop_orders = ClientShopOrderSerializer(many=True, read_only=True)
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        # Всё, что читают вложенные сериализаторы, подтягиваем заранее
+        return queryset.prefetch_related(
+            Prefetch(
+                "shop_orders",
+                queryset=ShopOrder.objects.select_related("shop").prefetch_related(
+                    Prefetch("items", queryset=OrderItem.objects.select_related("product_info__product")),
+                ),
+            )
+        )
+
     class Meta:
         model = Order
         fields = (
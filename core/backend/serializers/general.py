@@ -70,9 +70,9 @@ class ProductInfoCatalogSerializer(serializers.ModelSerializer):
 class ShopPublicSerializer(serializers.ModelSerializer):
     categories = CategorySerializer(many=True, read_only=True)
 
-    offers_count = serializers.IntegerField(read_only=True)
-    min_price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
-    max_price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    offers_count = serializers.IntegerField(source="offers_count_cached", read_only=True)
+    min_price = serializers.DecimalField(source="min_price_cached", max_digits=10, decimal_places=2, read_only=True)
+    max_price = serializers.DecimalField(source="max_price_cached", max_digits=10, decimal_places=2, read_only=True)
 
     class Meta:
         model = Shop
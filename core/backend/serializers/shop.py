@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from backend.models import ShopOrder, OrderItem, Shop, Category, ProductInfo, Product, Parameter, ProductParameter
 from django.db import transaction
+from backend.cache import invalidate_catalog
 
 # Сериализатор для позиций заказа
 class ShopOrderItemSerializer(serializers.ModelSerializer):
@@ -389,6 +390,8 @@ class ProductInfoUpdateSerializer(serializers.ModelSerializer):
             ]
             if to_delete_ids:
                 ProductParameter.objects.filter(id__in=to_delete_ids).delete()
+                # массовое удаление кэш каталога не сбрасывает (см. signals)
+                invalidate_catalog()
 
         # установить параметры
         if params:
@@ -0,0 +1,141 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max, Min, QuerySet
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from backend.cache import (
+    auth_token_key, invalidate_catalog, invalidate_shop_id, invalidate_shop_profiles, invalidate_user_tokens,
+)
+from backend.models import (
+    Order, Shop, Category, Product, ProductInfo, ProductParameter,
+)
+
+
+# Пользователь из кэша токена не должен устаревать после изменения профиля/email/пароля.
+# update_last_login при каждом логине сохраняет только last_login — его из кэша не читаем
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def drop_cached_user_token(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) == {"last_login"}:
+        return
+    invalidate_user_tokens(instance.pk)
+
+
+# Logout удаляет токен — вместе с ним уходит и запись в кэше
+@receiver(post_delete, sender=Token)
+def drop_cached_token(sender, instance, **kwargs):
+    cache.delete(auth_token_key(instance.key))
+
+
+def touch_baskets(**lookup) -> None:
+    # Корзина показывает данные оффера/товара/магазина — после их изменения кэш корзины устаревает
+    Order.objects.filter(status=Order.Status.BASKET, **lookup).update(updated_at=timezone.now())
+
+
+# Удаление оффера уносит позиции корзин каскадом, мимо _touch_basket.
+# Массовое удаление (origin — QuerySet) двигает корзины само (см. import_shop_yaml_task)
+@receiver(post_save, sender=ProductInfo)
+@receiver(pre_delete, sender=ProductInfo)
+def touch_baskets_on_product_info(sender, instance, created=False, origin=None, **kwargs):
+    if created or isinstance(origin, QuerySet):
+        return
+    touch_baskets(shop_orders__items__product_info_id=instance.pk)
+
+
+@receiver(post_save, sender=Product)
+def touch_baskets_on_product(sender, instance, created=False, **kwargs):
+    if not created:
+        touch_baskets(shop_orders__items__product_info__product_id=instance.pk)
+
+
+@receiver(post_save, sender=Shop)
+def touch_baskets_on_shop(sender, instance, created=False, **kwargs):
+    if not created:
+        touch_baskets(shop_orders__shop_id=instance.pk)
+
+
+def recalculate_shop_offers(shop_id: int) -> None:
+    agg = ProductInfo.objects.filter(shop_id=shop_id).aggregate(
+        offers_count=Count("id"),
+        min_price=Min("price"),
+        max_price=Max("price"),
+    )
+    Shop.objects.filter(id=shop_id).update(
+        offers_count_cached=agg["offers_count"],
+        min_price_cached=agg["min_price"],
+        max_price_cached=agg["max_price"],
+    )
+
+
+# Агрегаты публичного профиля магазина (offers_count/min_price/max_price).
+# Массовое удаление (origin — QuerySet) шлёт сигнал на каждую строку; пересчёт на каждую
+# дал бы O(N^2), поэтому его делает сам код, который удаляет пачкой (см. import_shop_yaml_task)
+@receiver(post_save, sender=ProductInfo)
+@receiver(post_delete, sender=ProductInfo)
+def update_shop_offers_on_product_info(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, QuerySet):
+        return
+    recalculate_shop_offers(instance.shop_id)
+
+
+# Любое изменение витрины сбрасывает кэш публичного каталога
+@receiver(post_save, sender=Shop)
+@receiver(post_delete, sender=Shop)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductInfo)
+@receiver(post_delete, sender=ProductInfo)
+@receiver(post_save, sender=ProductParameter)
+@receiver(post_delete, sender=ProductParameter)
+def drop_catalog_cache(sender, origin=None, **kwargs):
+    if isinstance(origin, QuerySet):
+        return
+    invalidate_catalog()
+
+
+# Кэш ответа GET /api/shop/me/: поля магазина и названия его категорий
+@receiver(post_save, sender=Shop)
+def drop_shop_profile_on_shop(sender, instance, **kwargs):
+    invalidate_shop_profiles([instance.pk])
+
+
+# Переименование/удаление категории меняет профиль всех магазинов, где она есть
+# (при удалении связи уходят каскадом без m2m_changed, поэтому магазины берём до удаления)
+@receiver(post_save, sender=Category)
+@receiver(pre_delete, sender=Category)
+def drop_shop_profile_on_category(sender, instance, **kwargs):
+    invalidate_shop_profiles(instance.shops.values_list("id", flat=True))
+
+
+@receiver(m2m_changed, sender=Category.shops.through)
+def drop_shop_profile_on_categories_change(sender, instance, action, pk_set=None, **kwargs):
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if isinstance(instance, Shop):
+        invalidate_shop_profiles([instance.pk])
+    elif pk_set:
+        invalidate_shop_profiles(pk_set)
+    else:
+        invalidate_shop_profiles(instance.shops.values_list("id", flat=True))
+
+
+# Кэш user -> shop_id (get_shop_id): новый владелец после сохранения, прежний — до него.
+# Сохранения с update_fields без user (профиль, импорт) владельца не меняют — лишнего запроса нет
+@receiver(pre_save, sender=Shop)
+def drop_shop_id_of_previous_owner(sender, instance, update_fields=None, **kwargs):
+    if instance.pk is None or (update_fields is not None and "user" not in update_fields):
+        return
+    old_user_id = Shop.objects.filter(pk=instance.pk).values_list("user_id", flat=True).first()
+    if old_user_id and old_user_id != instance.user_id:
+        invalidate_shop_id(old_user_id)
+
+
+@receiver(post_save, sender=Shop)
+@receiver(post_delete, sender=Shop)
+def drop_shop_id_of_owner(sender, instance, **kwargs):
+    if instance.user_id:
+        invalidate_shop_id(instance.user_id)
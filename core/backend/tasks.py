@@ -1,17 +1,33 @@
 from celery import shared_task
-from django.core.mail import send_mail
+from django.core.mail import send_mail, EmailMessage, get_connection
 from django.core.exceptions import ObjectDoesNotExist
 from django.conf import settings
 import requests
-from django.db import transaction
-from yaml import safe_load
+import urllib3
+from requests.adapters import HTTPAdapter
+from django.db import DatabaseError, transaction
+from django.db.models import Prefetch, Sum
+from yaml import load as yaml_load
 from yaml.error import YAMLError
 
+# LibYAML-парсер в разы быстрее чистого Python; без собранного libyaml — обычный SafeLoader
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
+
+from backend.cache import invalidate_catalog
+from backend.signals import recalculate_shop_offers, touch_baskets
 from backend.models import (
     Shop, Category, Product, ProductInfo,
-    Parameter, ProductParameter
+    Parameter, ProductParameter, Order, ShopOrder
 )
 
+# Одна сессия на процесс воркера: keep-alive и пул соединений к серверам поставщиков
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=8, pool_maxsize=32))
+_SESSION.mount("http://", HTTPAdapter(pool_connections=8, pool_maxsize=32))
+
 
 @shared_task(bind=True, autoretry_for=(Exception,), retry_backoff=True, max_retries=3)
 def send_email_task(self, subject: str, message: str, recipient_list: list[str]):
@@ -24,20 +40,173 @@ def send_email_task(self, subject: str, message: str, recipient_list: list[str])
     )
 
 
+def _format_address(order: Order) -> str:
+    parts = [order.shipping_country, order.shipping_city, order.shipping_street, order.shipping_house]
+    addr = ", ".join([p for p in parts if p])
+    if order.shipping_apartment:
+        addr += f", кв. {order.shipping_apartment}"
+    return addr or "(адрес не указан)"
+
+
+def _shop_invoice_message(shop_order: ShopOrder) -> EmailMessage | None:
+    shop = shop_order.shop
+    to_email = getattr(shop.user, "email", None) if shop.user else None
+    if not to_email:
+        return None
+
+    order = shop_order.order
+    address = _format_address(order)
+
+    lines = []
+    for item in shop_order.items.all():
+        line_sum = item.line_total
+        lines.append(f"- {item.product_info.product.name} ({item.product_info.product.model}) x{item.quantity} = {line_sum}")
+
+    subject = f"Накладная: заказ #{order.id} — магазин {shop.name}"
+    body = (
+        f"Заказ: #{order.id}\n"
+        f"Магазин: {shop.name}\n"
+        f"Адрес доставки: {address}\n\n"
+        f"Позиции:\n" + "\n".join(lines) + "\n\n"
+        f"Итого: {shop_order.total}\n"
+    )
+
+    return EmailMessage(subject, body, settings.DEFAULT_FROM_EMAIL, [to_email])
+
+
+def _buyer_confirmation_message(order: Order, shop_orders: list[ShopOrder]) -> EmailMessage | None:
+    to_email = getattr(order.user, "email", None)
+    if not to_email:
+        return None
+
+    address = _format_address(order)
+    subject = f"Заказ #{order.id} принят"
+
+    # итог по подзаказу уже посчитан в БД (аннотация total)
+    total = sum(so.total for so in shop_orders)
+    lines = []
+    for so in shop_orders:
+        lines.append(f"\nМагазин: {so.shop.name}")
+        for item in so.items.all():
+            line_sum = item.line_total
+            lines.append(f"- {item.product_info.product.name} x{item.quantity} = {line_sum}")
+
+    lines_text = "\n".join(lines)
+
+    body = (
+        f"Ваш заказ #{order.id} принят.\n"
+        f"Адрес доставки: {address}\n"
+        f"{lines_text}\n"
+        f"Итого по заказу: {total}\n"
+    )
+
+    return EmailMessage(subject, body, settings.DEFAULT_FROM_EMAIL, [to_email])
+
+
+def _admin_invoice_message(order: Order, shop_orders: list[ShopOrder]) -> EmailMessage | None:
+    if not settings.ADMINS:
+        return None
+
+    admin_emails = [email for _, email in settings.ADMINS]
+
+    address = _format_address(order)
+
+    total = sum(so.total for so in shop_orders)
+    lines = []
+
+    subject = f"Заказ #{order.id} принят"
+    for so in shop_orders:
+        lines.append(f"\nМагазин: {so.shop.name}")
+        for item in so.items.all():
+            line_sum = item.line_total
+            lines.append(
+                f"- {item.product_info.product.name} "
+                f"({item.product_info.product.model}) "
+                f"x{item.quantity} = {line_sum}"
+            )
+    lines_text = "\n".join(lines)
+    body = (
+        f"Новая накладная по заказу #{order.id}\n\n"
+        f"Покупатель: {order.user.email}\n"
+        f"Адрес доставки: {address}\n"
+        f"{lines_text}\n"
+        f"Итого: {total}"
+    )
+
+    return EmailMessage(subject, body, settings.DEFAULT_FROM_EMAIL, admin_emails)
+
+
+@shared_task(bind=True, autoretry_for=(DatabaseError,), retry_backoff=True, max_retries=3)
+def send_order_emails_task(self, order_id: int, pending: list[str] | None = None):
+    # В брокер уходит только id заказа, письма собираются здесь.
+    # Подзаказы с позициями грузим одним Prefetch на все три вида писем.
+    order = (
+        Order.objects
+        .select_related("user")
+        .prefetch_related(Prefetch(
+            "shop_orders",
+            queryset=(
+                ShopOrder.objects
+                .select_related("shop", "shop__user")
+                .prefetch_related("items__product_info__product")
+                .annotate(total=Sum("items__line_total"))
+            ),
+        ))
+        .get(id=order_id)
+    )
+    shop_orders = list(order.shop_orders.all())
+
+    messages = {f"shop:{so.id}": _shop_invoice_message(so) for so in shop_orders}
+    messages["buyer"] = _buyer_confirmation_message(order, shop_orders)
+    messages["admin"] = _admin_invoice_message(order, shop_orders)
+    messages = {
+        key: m for key, m in messages.items()
+        if m is not None and (pending is None or key in pending)
+    }
+
+    # Все письма заказа уходят через одно SMTP-соединение; при сбое повторяем только недоставленные
+    sent = set()
+    error = None
+    try:
+        with get_connection(fail_silently=False) as connection:
+            for key, message in messages.items():
+                try:
+                    connection.send_messages([message])
+                except Exception as exc:
+                    error = exc
+                else:
+                    sent.add(key)
+    except Exception as exc:
+        error = exc
+
+    failed = [key for key in messages if key not in sent]
+    if failed:
+        raise self.retry(
+            exc=error,
+            kwargs={"order_id": order_id, "pending": failed},
+            countdown=2 ** self.request.retries,
+        )
+
+
 @shared_task(bind=True, autoretry_for=(Exception,), retry_backoff=5, retry_kwargs={"max_retries": 3})
 def import_shop_yaml_task(self, shop_id: int, url: str):
-    # 1) скачали YAML (это можно делать вне транзакции)
+    # 1) открыли поток с YAML (это можно делать вне транзакции)
     try:
-        resp = requests.get(url, timeout=10)
+        resp = _SESSION.get(url, timeout=10, stream=True)
         resp.raise_for_status()
     except requests.RequestException as e:
         raise RuntimeError(f"Не удалось скачать YAML: {e}")
 
-    # 2) распарсили YAML (тоже вне транзакции)
+    # 2) парсим прямо из потока (тоже вне транзакции): файл не держим в памяти ещё и байтами
     try:
-        data = safe_load(resp.content)
+        resp.raw.decode_content = True  # gzip/deflate распакует urllib3
+        data = yaml_load(resp.raw, Loader=_YamlLoader)
     except YAMLError:
         raise RuntimeError("Файл не является корректным YAML")
+    except urllib3.exceptions.HTTPError as e:
+        raise RuntimeError(f"Не удалось скачать YAML: {e}")
+    finally:
+        resp.close()
 
     if not isinstance(data, dict):
         raise RuntimeError("Некорректная структура YAML")
@@ -61,23 +230,29 @@ def import_shop_yaml_task(self, shop_id: int, url: str):
         # категории
         shop.categories.clear()
 
-        cat_map = {}
+        yaml_categories = {}
         for c in (data.get("categories") or []):
             cid = c.get("id")
             cname = (c.get("name") or "").strip()
             if cid is None or not cname:
                 continue
+            yaml_categories[cid] = cname
 
-            category_obj, _ = Category.objects.get_or_create(name=cname)
-            category_obj.shops.add(shop)
-            cat_map[cid] = category_obj
+        # категории по имени: существующие одним запросом (name не уникален — первый по id),
+        # недостающие одним INSERT, связь с магазином — одним add()
+        categories = {}
+        for category_obj in Category.objects.filter(name__in=set(yaml_categories.values())).order_by("id"):
+            categories.setdefault(category_obj.name, category_obj)
+        new_categories = [Category(name=cname) for cname in set(yaml_categories.values()) if cname not in categories]
+        for category_obj in Category.objects.bulk_create(new_categories):
+            categories[category_obj.name] = category_obj
 
-        # очистим старые офферы магазина
-        ProductInfo.objects.filter(shop=shop).delete()
+        cat_map = {cid: categories[cname] for cid, cname in yaml_categories.items()}
+        shop.categories.add(*categories.values())
 
-        # товары
+        # товары: сначала разбираем строки, потом пишем пачками
+        goods = []
         for item in (data.get("goods") or []):
-            external_id = item.get("id", 0)
             model = (item.get("model") or "").strip()
             name = (item.get("name") or "").strip()
             cid = item.get("category")
@@ -89,10 +264,55 @@ def import_shop_yaml_task(self, shop_id: int, url: str):
             if not category_obj:
                 continue
 
-            product, _ = Product.objects.get_or_create(
-                model=model,
-                defaults={"name": name, "category": category_obj},
+            goods.append((item, model, name, category_obj))
+
+        # продукты: существующие одним запросом, недостающие одним INSERT
+        products = Product.objects.filter(model__in={g[1] for g in goods}).in_bulk(field_name="model")
+        new_products = {}
+        for _, model, name, category_obj in goods:
+            if model not in products and model not in new_products:
+                new_products[model] = Product(model=model, name=name, category=category_obj)
+        if new_products:
+            # model уникален: INSERT ... ON CONFLICT (model) DO UPDATE вернёт pk и для строк,
+            # которые успел создать параллельный импорт (им заодно проставятся name/category из файла)
+            Product.objects.bulk_create(
+                new_products.values(),
+                batch_size=1000,
+                update_conflicts=True,
+                unique_fields=["model"],
+                update_fields=["name", "category"],
             )
+            products.update(new_products)
+
+        # параметры: name не уникален, берём первый существующий
+        param_names = {
+            str(pname)
+            for item, *_ in goods
+            if isinstance(item.get("parameters"), dict)
+            for pname in item["parameters"]
+        }
+        params = {}
+        for param_obj in Parameter.objects.filter(name__in=param_names).order_by("id"):
+            params.setdefault(param_obj.name, param_obj)
+        new_params = [Parameter(name=pname) for pname in param_names if pname not in params]
+        for param_obj in Parameter.objects.bulk_create(new_params, batch_size=1000):
+            params[param_obj.name] = param_obj
+
+        # офферы магазина сверяем с файлом по external_id, а не удаляем и создаём заново:
+        # неизменные строки (и их параметры) не трогаем вовсе
+        existing = {
+            pi.external_id: pi
+            for pi in ProductInfo.objects.filter(shop=shop).only(
+                "id", "external_id", "product_id", "quantity", "price", "price_rrc"
+            )
+        }
+
+        offers = []
+        to_insert = []
+        to_update = []
+        changed_products = {}
+        for item, model, name, category_obj in goods:
+            product = products[model]
 
             p_updated = False
             if product.name != name:
@@ -102,25 +322,71 @@ def import_shop_yaml_task(self, shop_id: int, url: str):
                 product.category = category_obj
                 p_updated = True
             if p_updated:
-                product.save(update_fields=["name", "category_id"])
-
-            product_info = ProductInfo.objects.create(
-                product=product,
-                shop=shop,
-                external_id=external_id,
-                quantity=item.get("quantity", 0),
-                price=item.get("price", 0),
-                price_rrc=item.get("price_rrc", 0),
-            )
+                changed_products[product.pk] = product
+
+            fields = {
+                "product_id": product.pk,
+                "quantity": item.get("quantity", 0),
+                "price": item.get("price", 0),
+                "price_rrc": item.get("price_rrc", 0),
+            }
+            product_info = existing.get(item.get("id", 0))
+            if product_info is None:
+                product_info = ProductInfo(shop=shop, external_id=item.get("id", 0), **fields)
+                to_insert.append(product_info)
+            elif any(getattr(product_info, k) != v for k, v in fields.items()):
+                for k, v in fields.items():
+                    setattr(product_info, k, v)
+                to_update.append(product_info)
+            offers.append((item, product_info))
+
+        # изменившиеся name/category — одним UPDATE ... CASE на пачку
+        Product.objects.bulk_update(changed_products.values(), ["name", "category"], batch_size=1000)
 
-            params = item.get("parameters") or {}
-            if isinstance(params, dict):
-                for pname, pvalue in params.items():
-                    param_obj, _ = Parameter.objects.get_or_create(name=str(pname))
-                    ProductParameter.objects.create(
+        # офферы, которых больше нет в файле
+        # (receiver-ы на массовое удаление агрегаты не пересчитывают — делаем это в конце)
+        keep_ids = {item.get("id", 0) for item, _ in offers}
+        ProductInfo.objects.filter(shop=shop).exclude(external_id__in=keep_ids).delete()
+
+        ProductInfo.objects.bulk_update(to_update, ["product_id", "quantity", "price", "price_rrc"], batch_size=1000)
+        # bulk_create проставляет pk (PostgreSQL возвращает их через RETURNING)
+        ProductInfo.objects.bulk_create(to_insert, batch_size=1000)
+
+        # параметры сверяем так же — по (оффер, параметр)
+        current_params = {
+            (pp.product_info_id, pp.parameter_id): pp
+            for pp in ProductParameter.objects.filter(product_info__shop=shop).only(
+                "id", "product_info_id", "parameter_id", "value"
+            )
+        }
+        params_to_insert = []
+        params_to_update = []
+        for item, product_info in offers:
+            item_params = item.get("parameters") or {}
+            if not isinstance(item_params, dict):
+                continue
+            for pname, pvalue in item_params.items():
+                key = (product_info.pk, params[str(pname)].pk)
+                pp = current_params.pop(key, None)
+                if pp is None:
+                    params_to_insert.append(ProductParameter(
                         product_info=product_info,
-                        parameter=param_obj,
+                        parameter=params[str(pname)],
                         value=str(pvalue),
-                    )
+                    ))
+                elif pp.value != str(pvalue):
+                    pp.value = str(pvalue)
+                    params_to_update.append(pp)
+
+        # всё, что осталось в current_params, из файла пропало
+        if current_params:
+            ProductParameter.objects.filter(id__in=[pp.id for pp in current_params.values()]).delete()
+        ProductParameter.objects.bulk_update(params_to_update, ["value"], batch_size=1000)
+        ProductParameter.objects.bulk_create(params_to_insert, batch_size=1000)
+
+        # bulk-операции сигналов не шлют: агрегаты магазина, кэш каталога и корзин обновляем сами
+        recalculate_shop_offers(shop.id)
+        invalidate_catalog()
+        touch_baskets(shop_orders__shop_id=shop.id)
 
     return {"success": True, "shop_id": shop_id}
\ No newline at end of file
@@ -1,3 +1,5 @@
+import io
+import json
 from decimal import Decimal
 from unittest.mock import patch, Mock
 from django.core import mail
@@ -7,9 +9,12 @@ from django.utils.http import urlsafe_base64_encode
 from django.utils.encoding import force_bytes
 
 from django.conf import settings
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APITestCase, APIClient
 from rest_framework.authtoken.models import Token
+from rest_framework.utils.encoders import JSONEncoder
 from django.core.cache import cache
 
 
@@ -17,6 +22,8 @@ from backend.models import (
     Shop, Category, Product, ProductInfo, Parameter, ProductParameter,
     Order, ShopOrder, OrderItem, Address, User
 )
+from backend.cache import catalog_cache_key, get_default_address
+from backend.serializers.shop import ProductInfoReadSerializer, ShopOrderSerializer
 
 User = get_user_model()
 
@@ -30,6 +37,9 @@ class BaseAPITestCase(APITestCase):
         super().setUp()
         self.client = APIClient()
 
+        # Кэш (адрес по умолчанию и т.п.) не должен протекать между тестами
+        cache.clear()
+
         # Чтобы письма реально попадали в mail.outbox
         self._old_email_backend = settings.EMAIL_BACKEND
         settings.EMAIL_BACKEND = "django.core.mail.backends.locmem.EmailBackend"
@@ -95,6 +105,37 @@ class AuthFlowTests(BaseAPITestCase):
         self.assertEqual(r.status_code, 200)
         self.assertIn("token", r.data)
 
+    def test_change_password_drops_cached_user(self):
+        user = User.objects.create_user(
+            email="pass@example.com",
+            password="StrongPass123!",
+            username="pass",
+            is_active=True,
+        )
+        self.auth_as(user)
+        url = "/api/client/profile/password/"
+
+        with self.captureOnCommitCallbacks(execute=True):
+            r = self.client.post(url, {"old_password": "StrongPass123!", "new_password": "NewStrongPass456!"}, format="json")
+        self.assertEqual(r.status_code, 200)
+
+        # Пользователь из кэша токена не должен помнить старый пароль
+        r = self.client.post(url, {"old_password": "StrongPass123!", "new_password": "OtherPass789!"}, format="json")
+        self.assertEqual(r.status_code, 400)
+
+        user.refresh_from_db()
+        self.assertTrue(user.check_password("NewStrongPass456!"))
+
+    def test_last_login_save_keeps_token_cache(self):
+        user = User.objects.create_user(email="login@example.com", password="StrongPass123!", is_active=True)
+        Token.objects.create(user=user)
+
+        # update_last_login на каждом логине не должен ходить за токенами пользователя
+        with CaptureQueriesContext(connection) as ctx, self.captureOnCommitCallbacks() as callbacks:
+            user.save(update_fields=["last_login"])
+        self.assertEqual(callbacks, [])
+        self.assertFalse(any("authtoken_token" in q["sql"] for q in ctx.captured_queries))
+
 
 class CatalogAndBasketTests(BaseAPITestCase):
     def setUp(self):
@@ -168,6 +209,71 @@ class CatalogAndBasketTests(BaseAPITestCase):
         self.assertEqual(r.status_code, 200)
         self.assertTrue(len(r.data) >= 1)
 
+        # Публичный профиль магазина: агрегаты по офферам
+        r = self.client.get(f"/api/shops/{self.shop.id}/")
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.data["offers_count"], 1)
+        self.assertEqual(r.data["min_price"], "100.00")
+
+    def test_catalog_cache_invalidated_on_offer_change(self):
+        r = self.client.get("/api/catalog/")
+        self.assertEqual(r.data[0]["price"], "100.00")
+
+        # Изменение оффера меняет версию каталога после коммита
+        with self.captureOnCommitCallbacks(execute=True):
+            self.offer.price = Decimal("90.00")
+            self.offer.save(update_fields=["price"])
+
+        r = self.client.get("/api/catalog/")
+        self.assertEqual(r.data[0]["price"], "90.00")
+
+    def test_catalog_version_after_lost_add_race(self):
+        # параллельный запрос успел записать свою версию между get и add
+        with patch("backend.cache.cache") as mocked:
+            mocked.get.side_effect = [None, 123]
+            mocked.add.return_value = False
+            self.assertEqual(catalog_cache_key("/api/catalog/"), "catalog:123:/api/catalog/")
+
+    def test_default_address_edit_reaches_basket(self):
+        self.auth_as(self.buyer)
+        get_default_address(self.buyer)  # адрес по умолчанию уже в кэше
+
+        # правка полей текущего default (без is_default в запросе) сбрасывает кэш
+        with self.captureOnCommitCallbacks(execute=True):
+            r = self.client.patch(f"/api/client/profile/addresses/{self.addr.id}/", {"city": "Kazan"}, format="json")
+        self.assertEqual(r.status_code, 200)
+
+        r = self.client.get("/api/buyer/basket/")
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.data["shipping_city"], "Kazan")
+
+    def test_basket_cache_follows_offer_delete(self):
+        self.auth_as(self.buyer)
+        r = self.client.post(
+            "/api/buyer/basket/items/", {"product_info_id": self.offer.id, "quantity": 1}, format="json"
+        )
+        self.assertEqual(r.status_code, 200)
+        r = self.client.get("/api/buyer/basket/")
+        self.assertEqual(len(r.data["shop_orders"][0]["items"]), 1)
+
+        # продавец удалил оффер — позиция ушла каскадом, мимо _touch_basket
+        self.offer.delete()
+        r = self.client.get("/api/buyer/basket/")
+        self.assertEqual(r.data["shop_orders"][0]["items"], [])
+        self.assertEqual(Decimal(r.data["total_sum"]), Decimal("0"))
+
+    def test_basket_add_bumps_version_once(self):
+        self.auth_as(self.buyer)
+        url = "/api/buyer/basket/items/"
+        self.client.post(url, {"product_info_id": self.offer.id, "quantity": 1}, format="json")
+
+        with CaptureQueriesContext(connection) as ctx:
+            r = self.client.post(url, {"product_info_id": self.offer.id, "quantity": 1}, format="json")
+        self.assertEqual(r.status_code, 200)
+        bumps = [q["sql"] for q in ctx.captured_queries
+                 if q["sql"].startswith('UPDATE "backend_order"') and "updated_at" in q["sql"]]
+        self.assertEqual(len(bumps), 1)
+
     def test_basket_add_remove_checkout_and_emails(self):
         self.auth_as(self.buyer)
 
@@ -188,7 +294,9 @@ class CatalogAndBasketTests(BaseAPITestCase):
 
         # 3) checkout (без address_id — должен взять default)
         mail.outbox = []
-        r = self.client.post("/api/buyer/basket/checkout/", {}, format="json")
+        # письма ставятся в очередь после коммита транзакции оформления
+        with self.captureOnCommitCallbacks(execute=True):
+            r = self.client.post("/api/buyer/basket/checkout/", {}, format="json")
         self.assertEqual(r.status_code, 200)
         self.assertTrue(r.data["success"])
         order_id = r.data["order_id"]
@@ -228,6 +336,150 @@ class CatalogAndBasketTests(BaseAPITestCase):
 
         r = self.client.post("/api/buyer/basket/items/remove/", {"order_item_id": item.id}, format="json")
         self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.data["shop_orders"], [])
+
+        # корзина из кэша не должна отдавать удалённую позицию
+        r = self.client.get("/api/buyer/basket/")
+        self.assertEqual(r.data["shop_orders"], [])
+
+    def test_checkout_email_retry_resends_only_failed(self):
+        from celery.exceptions import Retry
+        from django.core.mail.backends.locmem import EmailBackend
+        from backend.tasks import send_order_emails_task
+
+        self.auth_as(self.buyer)
+        self.client.post("/api/buyer/basket/items/", {"product_info_id": self.offer.id, "quantity": 1}, format="json")
+
+        real_send = EmailBackend.send_messages
+
+        def flaky_send(backend, messages):
+            if messages[0].to == ["buyer@example.com"]:
+                raise ConnectionError("smtp down")
+            return real_send(backend, messages)
+
+        # письмо покупателю не ушло — повтор задачи получает только его
+        with patch.object(EmailBackend, "send_messages", flaky_send), \
+                patch.object(send_order_emails_task, "retry", side_effect=Retry()) as retry:
+            with self.assertRaises(Retry), self.captureOnCommitCallbacks(execute=True):
+                self.client.post("/api/buyer/basket/checkout/", {}, format="json")
+        order_id = Order.objects.filter(user=self.buyer).exclude(status=Order.Status.BASKET).get().id
+        self.assertEqual(retry.call_args.kwargs["kwargs"], {"order_id": order_id, "pending": ["buyer"]})
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ["admin@example.com", "shop@example.com"])
+
+        send_order_emails_task.apply(kwargs=retry.call_args.kwargs["kwargs"])
+        self.assertEqual(
+            sorted(m.to[0] for m in mail.outbox),
+            ["admin@example.com", "buyer@example.com", "shop@example.com"],
+        )
+
+
+class AddressDefaultTests(BaseAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.buyer = User.objects.create_user(
+            email="addr@example.com",
+            password="StrongPass123!",
+            type="buyer",
+            is_active=True,
+        )
+        self.auth_as(self.buyer)
+
+    def _create(self, label, **extra):
+        payload = {"label": label, "country": "RU", "city": "Moscow", "street": "Tverskaya", "house": "1"}
+        payload.update(extra)
+        r = self.client.post("/api/client/profile/addresses/", payload, format="json")
+        self.assertEqual(r.status_code, 201)
+        return r.data["id"]
+
+    def test_single_default_address(self):
+        first = self._create("Home")
+        self.assertTrue(Address.objects.get(id=first).is_default)
+
+        # новый адрес с is_default=true забирает флаг у старого
+        second = self._create("Work", is_default=True)
+        defaults = list(Address.objects.filter(user=self.buyer, is_default=True).values_list("id", flat=True))
+        self.assertEqual(defaults, [second])
+
+        # явное назначение default возвращает флаг первому
+        r = self.client.post(f"/api/client/profile/addresses/{first}/set-default/")
+        self.assertEqual(r.status_code, 200)
+        defaults = list(Address.objects.filter(user=self.buyer, is_default=True).values_list("id", flat=True))
+        self.assertEqual(defaults, [first])
+
+        # PATCH с is_default=true (строкой из формы) тоже переносит флаг
+        r = self.client.patch(f"/api/client/profile/addresses/{second}/", {"is_default": "true"})
+        self.assertEqual(r.status_code, 200)
+        self.assertTrue(r.data["is_default"])
+        defaults = list(Address.objects.filter(user=self.buyer, is_default=True).values_list("id", flat=True))
+        self.assertEqual(defaults, [second])
+        self.client.post(f"/api/client/profile/addresses/{first}/set-default/")
+
+        # удаление default-адреса назначает default оставшемуся
+        r = self.client.delete(f"/api/client/profile/addresses/{first}/")
+        self.assertEqual(r.status_code, 204)
+        self.assertTrue(Address.objects.get(id=second).is_default)
+
+
+class ClientOrdersTests(BaseAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.buyer = User.objects.create_user(
+            email="orders@example.com",
+            password="StrongPass123!",
+            type="buyer",
+            is_active=True,
+        )
+        cat = Category.objects.create(name="Phones")
+        Address.objects.create(
+            user=self.buyer, label="Home", country="RU", city="Moscow", street="Tverskaya", house="1",
+            is_default=True,
+        )
+        basket = Order.objects.create(user=self.buyer, status=Order.Status.BASKET)
+
+        # 2 магазина x 2 позиции: на JOIN-агрегатах это давало завышенный total
+        for s_idx in range(2):
+            shop = Shop.objects.create(name=f"Shop {s_idx}", state=True)
+            so = ShopOrder.objects.create(order=basket, shop=shop, status=ShopOrder.Status.BASKET)
+            for i_idx in range(2):
+                product = Product.objects.create(name=f"P{s_idx}{i_idx}", category=cat, model=f"p-{s_idx}-{i_idx}")
+                pi = ProductInfo.objects.create(
+                    product=product, shop=shop, external_id=i_idx,
+                    quantity=10, price=Decimal("10.00"), price_rrc=Decimal("12.00"),
+                )
+                OrderItem.objects.create(shop_order=so, product_info=pi, quantity=2, price_at_purchase=pi.price)
+
+        # агрегаты заказа заполняются при оформлении
+        self.auth_as(self.buyer)
+        with self.captureOnCommitCallbacks(execute=True):
+            r = self.client.post("/api/buyer/basket/checkout/", {}, format="json")
+        self.assertEqual(r.status_code, 200)
+        self.order = Order.objects.get(id=r.data["order_id"])
+
+    def test_orders_list_aggregates(self):
+        r = self.client.get("/api/client/orders/")
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.data["count"], 1)
+
+        row = r.data["results"][0]
+        self.assertEqual(row["id"], self.order.id)
+        self.assertEqual(row["total"], "80.00")
+        self.assertEqual(row["shops_count"], 2)
+        self.assertEqual(row["items_count"], 4)
+
+        # деталка: все подзаказы и позиции фиксированным числом запросов
+        with self.assertNumQueries(3):
+            r = self.client.get(f"/api/client/orders/{self.order.id}/")
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(sum(len(so["items"]) for so in r.data["shop_orders"]), 4)
+
+        r = self.client.get("/api/client/orders/999999/")
+        self.assertEqual(r.status_code, 404)
+        self.assertEqual(r.data["detail"], "Заказ не найден.")
+
+        # удаление оффера не переписывает сумму уже оформленного заказа
+        ProductInfo.objects.filter(order_items__shop_order__order=self.order).first().delete()
+        r = self.client.get("/api/client/orders/")
+        self.assertEqual(r.data["results"][0]["total"], "80.00")
 
 
 SAMPLE_YAML = """
@@ -245,6 +497,16 @@ goods:
     quantity: 5
     parameters:
       Цвет: черный
+  - id: 11
+    category: 1
+    model: iphone-15-pro
+    name: iPhone 15 Pro
+    price: 119990
+    price_rrc: 129990
+    quantity: 2
+    parameters:
+      Цвет: белый
+      Память: 256
 """
 class ShopImportAndOrdersTests(TestCase):
     def setUp(self):
@@ -257,12 +519,13 @@ class ShopImportAndOrdersTests(TestCase):
             is_active=True,
         )
         self.shop = Shop.objects.create(user=self.shop_user, name="Мой магазин", state=True)
+        cache.clear()
 
         # логинимся (если у тебя токены — можешь поставить force_authenticate)
         self.client.force_authenticate(self.shop_user)
 
     @patch("backend.views.shop.import_shop_yaml_task.delay")
-    @patch("backend.tasks.requests.get")
+    @patch("backend.tasks._SESSION.get")
     def test_shop_import_yaml_and_get_orders(self, mock_get, mock_delay):
         """
         1) POST /api/shop/me/import/ -> теперь 202 и задача уходит в Celery (delay)
@@ -270,17 +533,21 @@ class ShopImportAndOrdersTests(TestCase):
         3) GET /api/shop/me/orders/ -> возвращает подзаказы магазина
         """
 
-        # --- мок ответа requests.get для таска ---
-        resp = Mock()
-        resp.raise_for_status = Mock()
-        resp.content = SAMPLE_YAML.encode("utf-8")
-        mock_get.return_value = resp
+        # --- мок ответа HTTP-сессии таска (YAML читается из потока resp.raw) ---
+        feed = {"yaml": SAMPLE_YAML}
+
+        def make_resp(*args, **kwargs):
+            resp = Mock()
+            resp.raw = io.BytesIO(feed["yaml"].encode("utf-8"))
+            return resp
+        mock_get.side_effect = make_resp
 
         url = "https://example.com/test.yaml"
 
         # 1) импорт через API (теперь 202!)
         r = self.client.post("/api/shop/me/import/", {"url": url}, format="json")
         self.assertEqual(r.status_code, 202)
+        self.assertTrue(r.json()["success"])
         mock_delay.assert_called_once()  # задача реально поставлена в очередь
 
         # 2) запускаем таск синхронно, чтобы реально заполнить БД
@@ -289,7 +556,23 @@ class ShopImportAndOrdersTests(TestCase):
         self.assertTrue(result.get("success"))
 
         # проверим, что офферы появились
-        self.assertTrue(ProductInfo.objects.filter(shop=self.shop).exists())
+        self.assertEqual(ProductInfo.objects.filter(shop=self.shop).count(), 2)
+        self.assertEqual(
+            ProductParameter.objects.filter(product_info__shop=self.shop, parameter__name="Цвет").count(), 2
+        )
+
+        # повторный импорт: оффер обновляется на месте, пропавший параметр удаляется,
+        # продукты и параметры переиспользуются, агрегаты магазина пересчитаны
+        offer_id = ProductInfo.objects.get(shop=self.shop, external_id=10).id
+        feed["yaml"] = SAMPLE_YAML.replace("price: 89990", "price: 79990").replace("      Память: 256\n", "")
+        import_shop_yaml_task(self.shop.id, url)
+        self.assertEqual(ProductInfo.objects.get(shop=self.shop, external_id=10).id, offer_id)
+        self.assertFalse(ProductParameter.objects.filter(product_info__shop=self.shop, parameter__name="Память").exists())
+        self.assertEqual(Product.objects.count(), 2)
+        self.assertEqual(Parameter.objects.filter(name="Цвет").count(), 1)
+        self.shop.refresh_from_db()
+        self.assertEqual(self.shop.offers_count_cached, 2)
+        self.assertEqual(self.shop.min_price_cached, Decimal("79990"))
 
         # 3) создадим заказ, чтобы эндпоинт /orders/ было что отдавать
         buyer = User.objects.create_user(
@@ -306,8 +589,118 @@ class ShopImportAndOrdersTests(TestCase):
 
         r2 = self.client.get("/api/shop/me/orders/")
         self.assertEqual(r2.status_code, 200)
-        self.assertTrue(isinstance(r2.json(), list))
-        self.assertGreaterEqual(len(r2.json()), 1)
+        self.assertEqual(r2.json()["count"], 1)
+        self.assertEqual(r2.json()["results"][0]["order_id"], order.id)
+
+        # списки собираются из values(), но по форме совпадают с сериализаторами
+        self.assertEqual(r2.json()["results"], json.loads(json.dumps(
+            ShopOrderSerializer(ShopOrder.objects.filter(pk=so.pk), many=True).data, cls=JSONEncoder
+        )))
+
+        r_st = self.client.patch(f"/api/shop/me/orders/{order.id}/status/", {"status": "confirmed"}, format="json")
+        self.assertEqual(r_st.status_code, 200)
+        so.refresh_from_db()
+        self.assertEqual(so.status, ShopOrder.Status.CONFIRMED)
+        r_st = self.client.patch(f"/api/shop/me/orders/{order.id}/status/", {"status": "sent"}, format="json")
+        self.assertEqual(r_st.status_code, 400)
+
+        r3 = self.client.get("/api/shop/me/products/?limit=1")
+        self.assertEqual(r3.status_code, 200)
+        self.assertEqual(r3.json()["count"], 2)
+        self.assertEqual(len(r3.json()["results"]), 1)
+        newest = ProductInfo.objects.filter(shop=self.shop).order_by("-id").first()
+        self.assertEqual(r3.json()["results"][0], json.loads(json.dumps(ProductInfoReadSerializer(newest).data)))
+
+        r4 = self.client.get("/api/shop/me/products/?stream=1")
+        self.assertEqual(r4.status_code, 200)
+        rows = json.loads(b"".join(r4.streaming_content))
+        self.assertEqual(len(rows), 2)
+        self.assertIn("Цвет", [p["name"] for p in rows[0]["parameters"]])
+
+        # правка и удаление оффера пересчитывают агрегаты магазина
+        other = ProductInfo.objects.filter(shop=self.shop).exclude(id=pi.id).get()
+        r5 = self.client.patch(f"/api/shop/me/products/{other.id}/", {"price": "1000.00"}, format="json")
+        self.assertEqual(r5.status_code, 200)
+        self.shop.refresh_from_db()
+        self.assertEqual(self.shop.min_price_cached, Decimal("1000.00"))
+        r6 = self.client.delete(f"/api/shop/me/products/{other.id}/")
+        self.assertEqual(r6.status_code, 204)
+        self.shop.refresh_from_db()
+        self.assertEqual(self.shop.offers_count_cached, 1)
+
+        # эндпоинты продавца закрыты для покупателя
+        self.client.force_authenticate(buyer)
+        self.assertEqual(self.client.get("/api/shop/me/orders/").status_code, 403)
+
+
+    def test_shop_profile_cache_invalidated(self):
+        cache.clear()
+        r = self.client.get("/api/shop/me/")
+        self.assertEqual(r.json()["shop_data"]["categories"], [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            r = self.client.patch("/api/shop/me/", {"name": "Новое имя", "add_categories": ["Phones"]}, format="json")
+        self.assertEqual(r.status_code, 200)
+        r = self.client.get("/api/shop/me/")
+        self.assertEqual(r.json()["shop_data"]["name"], "Новое имя")
+        self.assertEqual(r.json()["shop_data"]["categories"], ["Phones"])
+
+        # переименование категории (например, из админки) тоже сбрасывает профиль
+        cat = Category.objects.get(name="Phones")
+        cat.name = "Smartphones"
+        with self.captureOnCommitCallbacks(execute=True):
+            cat.save()
+        r = self.client.get("/api/shop/me/")
+        self.assertEqual(r.json()["shop_data"]["categories"], ["Smartphones"])
+
+    def test_shop_id_cache_follows_owner(self):
+        other = User.objects.create_user(email="other@example.com", password="12345678", type="shop", is_active=True)
+        self.assertEqual(self.client.get("/api/shop/me/products/").status_code, 200)
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get("/api/shop/me/products/").status_code, 404)
+
+        # магазин передали другому владельцу — кэш сброшен у обоих
+        self.shop.user = other
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shop.save()
+        self.assertEqual(self.client.get("/api/shop/me/products/").status_code, 200)
+        self.client.force_authenticate(self.shop_user)
+        self.assertEqual(self.client.get("/api/shop/me/products/").status_code, 404)
+
+    def test_shop_lists_query_count_does_not_grow(self):
+        """
+        Списки офферов и подзаказов магазина: число запросов не зависит от числа строк
+        (select_related/prefetch_related синхронизированы с сериализаторами)
+        """
+        cat = Category.objects.create(name="Phones")
+        color = Parameter.objects.create(name="Цвет")
+        buyer = User.objects.create_user(email="buyer@example.com", password="12345678", type="buyer", is_active=True)
+
+        def add_offer_and_order(n):
+            product = Product.objects.create(name=f"Phone {n}", category=cat, model=f"phone-{n}")
+            pi = ProductInfo.objects.create(
+                product=product, shop=self.shop, external_id=n, quantity=5,
+                price=Decimal("10.00"), price_rrc=Decimal("12.00"),
+            )
+            ProductParameter.objects.create(product_info=pi, parameter=color, value="черный")
+            order = Order.objects.create(user=buyer, status=Order.Status.PLACED)
+            so = ShopOrder.objects.create(order=order, shop=self.shop, status=ShopOrder.Status.PROCESSING)
+            OrderItem.objects.create(shop_order=so, product_info=pi, quantity=1, price_at_purchase=pi.price)
+
+        def count_queries(url):
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            return len(ctx.captured_queries)
+
+        add_offer_and_order(1)
+        self.client.get("/api/shop/me/products/")  # прогрев кэша user -> shop_id
+        products_one = count_queries("/api/shop/me/products/")
+        orders_one = count_queries("/api/shop/me/orders/")
+
+        for n in range(2, 5):
+            add_offer_and_order(n)
+        self.assertEqual(count_queries("/api/shop/me/products/"), products_one)
+        self.assertEqual(count_queries("/api/shop/me/orders/"), orders_one)
 
 
 class ThrottleTests(TestCase):
@@ -326,6 +719,22 @@ class ThrottleTests(TestCase):
         self.assertIsNotNone(last)
         self.assertEqual(last.status_code, 429)
 
+
+class SchemaCacheTests(TestCase):
+    def test_schema_cached_on_server_only(self):
+        cache.clear()
+        first = self.client.get("/api/schema/")
+        self.assertEqual(first.status_code, 200)
+        self.assertIn("no-cache", first["Cache-Control"])
+        self.assertNotIn("max-age=86400", first["Cache-Control"])
+
+        # повторный запрос отдаётся из серверного кэша, схема не строится заново
+        with patch("drf_spectacular.views.SpectacularAPIView._get_schema_response") as build:
+            second = self.client.get("/api/schema/")
+        build.assert_not_called()
+        self.assertEqual(second.content, first.content)
+        self.assertIn("no-cache", second["Cache-Control"])
+
 import sys
 
 if "test" in sys.argv:
@@ -13,6 +13,7 @@ from django.core.mail import send_mail
 from drf_spectacular.utils import extend_schema, OpenApiResponse
 
 from backend.throttles import PasswordResetThrottle, AuthThrottle
+from utils import build_absolute
 
 
 
@@ -169,9 +170,7 @@ class PasswordResetRequestAPIView(APIView):
             uidb64 = urlsafe_base64_encode(force_bytes(user.pk))
             token = default_token_generator.make_token(user)
 
-            link = request.build_absolute_uri(
-                f"/api/auth/password/reset/confirm/{uidb64}/{token}/"
-            )
+            link = build_absolute(request, f"/api/auth/password/reset/confirm/{uidb64}/{token}/")
 
             send_mail(
                 subject="Сброс пароля",
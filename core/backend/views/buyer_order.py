@@ -1,6 +1,8 @@
-from django.conf import settings
+from decimal import Decimal
+
+from django.core.cache import cache
 from django.db import transaction
-from django.db.models import F
+from django.db.models import F, Prefetch
 from drf_spectacular.utils import extend_schema
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated, AllowAny
@@ -9,8 +11,9 @@ from rest_framework import status
 from backend.models import ProductInfo
 
 from backend.throttles import CheckoutThrottle
+from backend.cache import get_default_address, invalidate_catalog
 
-from backend.tasks import send_email_task
+from backend.tasks import send_order_emails_task
 
 from backend.models import Order, ShopOrder, OrderItem, Address
 from backend.serializers.buyer_order import (
@@ -22,6 +25,9 @@ from backend.serializers.buyer_order import (
 )
 
 
+BASKET_CACHE_TTL = 600
+
+
 def _require_buyer(request):
     if not request.user.is_authenticated:
         return
@@ -43,7 +49,7 @@ def _apply_address_to_order(order: Order, addr: Address) -> None:
     order.shipping_house = addr.house
     order.shipping_apartment = addr.apartment or ""
     order.save(update_fields=[
-        "shipping_country", "shipping_city", "shipping_street", "shipping_house", "shipping_apartment"
+        "shipping_country", "shipping_city", "shipping_street", "shipping_house", "shipping_apartment", "updated_at"
     ])
 
 
@@ -52,114 +58,37 @@ def _ensure_basket_has_address(basket: Order) -> None:
     if basket.shipping_country or basket.shipping_city or basket.shipping_street or basket.shipping_house:
         return
 
-    addr = Address.objects.filter(user=basket.user, is_default=True).first()
+    addr = get_default_address(basket.user)
     if addr:
         _apply_address_to_order(basket, addr)
 
 
-def _format_address(order: Order) -> str:
-    parts = [order.shipping_country, order.shipping_city, order.shipping_street, order.shipping_house]
-    addr = ", ".join([p for p in parts if p])
-    if order.shipping_apartment:
-        addr += f", кв. {order.shipping_apartment}"
-    return addr or "(адрес не указан)"
-
-
-def _send_shop_invoice(shop_order: ShopOrder):
-    shop = shop_order.shop
-    to_email = getattr(shop.user, "email", None) if shop.user else None
-    if not to_email:
-        return
-
-    order = shop_order.order
-    address = _format_address(order)
-
-    lines = []
-    total = 0
-    items = shop_order.items.select_related("product_info__product")
-    for item in items:
-        line_sum = item.quantity * item.price_at_purchase
-        total += line_sum
-        lines.append(f"- {item.product_info.product.name} ({item.product_info.product.model}) x{item.quantity} = {line_sum}")
-
-    subject = f"Накладная: заказ #{order.id} — магазин {shop.name}"
-    body = (
-        f"Заказ: #{order.id}\n"
-        f"Магазин: {shop.name}\n"
-        f"Адрес доставки: {address}\n\n"
-        f"Позиции:\n" + "\n".join(lines) + "\n\n"
-        f"Итого: {total}\n"
-    )
-
-    send_email_task.delay(subject, body, [to_email])
-
-
-def _send_buyer_confirmation(order: Order):
-    to_email = getattr(order.user, "email", None)
-    if not to_email:
-        return
-
-    address = _format_address(order)
-    subject = f"Заказ #{order.id} принят"
-
-    total = 0
-    lines = []
-    shop_orders = order.shop_orders.select_related("shop").prefetch_related("items__product_info__product")
-    for so in shop_orders:
-        lines.append(f"\nМагазин: {so.shop.name}")
-        for item in so.items.all():
-            line_sum = item.quantity * item.price_at_purchase
-            total += line_sum
-            lines.append(f"- {item.product_info.product.name} x{item.quantity} = {line_sum}")
-
-    lines_text = "\n".join(lines)
-
-    body = (
-        f"Ваш заказ #{order.id} принят.\n"
-        f"Адрес доставки: {address}\n"
-        f"{lines_text}\n"
-        f"Итого по заказу: {total}\n"
-    )
-
-    send_email_task.delay(subject, body, [to_email])
-
-def _send_admin_invoice(order: Order):
-    if not settings.ADMINS:
-        return
-
-    admin_emails = [email for _, email in settings.ADMINS]
-
-    address = _format_address(order)
+def _touch_basket(basket: Order) -> None:
+    # Позиции корзины живут в других таблицах, поэтому версию корзины двигаем явно
+    basket.save(update_fields=["updated_at"])
 
-    total = 0
-    lines = []
 
-    shop_orders = order.shop_orders.select_related("shop").prefetch_related(
-        "items__product_info__product"
-    )
-
-    subject = f"Заказ #{order.id} принят"
-    for so in shop_orders:
-        lines.append(f"\nМагазин: {so.shop.name}")
-        for item in so.items.all():
-            line_sum = item.quantity * item.price_at_purchase
-            total += line_sum
-            lines.append(
-                f"- {item.product_info.product.name} "
-                f"({item.product_info.product.model}) "
-                f"x{item.quantity} = {line_sum}"
-            )
-    lines_text = "\n".join(lines)
-    body = (
-        f"Новая накладная по заказу #{order.id}\n\n"
-        f"Покупатель: {order.user.email}\n"
-        f"Адрес доставки: {address}\n"
-        f"{lines_text}\n"
-        f"Итого: {total}"
+def _basket_for_serialization(basket: Order) -> Order:
+    # Одна цепочка prefetch на всё, что читает BasketSerializer (без N+1 по подзаказам/позициям)
+    return (
+        Order.objects
+        .prefetch_related(
+            "shop_orders__shop",
+            "shop_orders__items__product_info__product",
+            "shop_orders__items__product_info__shop",
+        )
+        .get(pk=basket.pk)
     )
 
-    send_email_task.delay(subject, body, admin_emails)
 
+def _serialized_basket(basket: Order) -> dict:
+    # Ключ включает updated_at: любое изменение корзины даёт новый ключ, старый просто истечёт
+    key = f"basket:{basket.id}:{int(basket.updated_at.timestamp() * 1e6)}"
+    data = cache.get(key)
+    if data is None:
+        data = BasketSerializer(_basket_for_serialization(basket)).data
+        cache.set(key, data, BASKET_CACHE_TTL)
+    return data
 
 
 class BasketAPIView(APIView):
@@ -181,7 +110,7 @@ class BasketAPIView(APIView):
         _require_buyer(request)
         basket = _get_or_create_basket(request.user)
         _ensure_basket_has_address(basket)
-        return Response(BasketSerializer(basket).data)
+        return Response(_serialized_basket(basket))
 
 
 class BasketAddAPIView(APIView):
@@ -225,10 +154,11 @@ class BasketAddAPIView(APIView):
         if not created:
             item.quantity = F("quantity") + quantity
             item.price_at_purchase = product_info.price
+            # Свежее значение quantity прочитает сериализатор корзины, отдельный SELECT не нужен
             item.save(update_fields=["quantity", "price_at_purchase"])
-            item.refresh_from_db()
 
-        return Response(BasketSerializer(basket).data, status=status.HTTP_200_OK)
+        _touch_basket(basket)
+        return Response(_serialized_basket(basket), status=status.HTTP_200_OK)
 
 
 class BasketRemoveAPIView(APIView):
@@ -271,7 +201,8 @@ class BasketRemoveAPIView(APIView):
         if not shop_order.items.exists():
             shop_order.delete()
 
-        return Response(BasketSerializer(basket).data, status=status.HTTP_200_OK)
+        _touch_basket(basket)
+        return Response(_serialized_basket(basket), status=status.HTTP_200_OK)
 
 
 class CheckoutAPIView(APIView):
@@ -303,9 +234,19 @@ class CheckoutAPIView(APIView):
     def post(self, request):
         _require_buyer(request)
 
-        basket = _get_or_create_basket(request.user)
-
-        if not basket.shop_orders.exists():
+        # Корзину грузим вместе с подзаказами одним Prefetch: из этого списка проверяем пустоту
+        # корзины, состояние магазинов и собираем, сколько какого ProductInfo нужно списать
+        basket = (
+            Order.objects
+            .filter(user=request.user, status=Order.Status.BASKET)
+            .prefetch_related(Prefetch(
+                "shop_orders",
+                queryset=ShopOrder.objects.select_related("shop").prefetch_related("items"),
+            ))
+            .first()
+        )
+        shop_orders = list(basket.shop_orders.all()) if basket else []
+        if not shop_orders:
             return Response({"detail": "Корзина пуста."}, status=status.HTTP_400_BAD_REQUEST)
 
         s = CheckoutSerializer(data=request.data, context={"request": request})
@@ -324,7 +265,8 @@ class CheckoutAPIView(APIView):
             o.shipping_house = a.house
             o.shipping_apartment = a.apartment or ""
             o.save(update_fields=[
-                "shipping_country", "shipping_city", "shipping_street", "shipping_house", "shipping_apartment"
+                "shipping_country", "shipping_city", "shipping_street", "shipping_house", "shipping_apartment",
+                "updated_at",
             ])
 
         if address_id is not None:
@@ -335,7 +277,7 @@ class CheckoutAPIView(APIView):
         else:
             # если пользователь раньше уже выбирал адрес для корзины — оставляем как есть
             if not _basket_has_address(basket):
-                addr = Address.objects.filter(user=request.user, is_default=True).first()
+                addr = get_default_address(request.user)
                 if not addr:
                     return Response(
                         {"detail": "Адрес доставки не выбран и нет адреса по умолчанию."},
@@ -343,12 +285,8 @@ class CheckoutAPIView(APIView):
                     )
                 _apply_address(basket, addr)
 
-        # Собираем, сколько какого ProductInfo нужно списать
-        # (prefetch по items, чтобы не плодить запросы)
-        shop_orders = basket.shop_orders.prefetch_related("items")
-
         # Проверяем, что все магазины всё ещё принимают заказы
-        bad_shop = basket.shop_orders.select_related("shop").filter(shop__state=False).first()
+        bad_shop = next((so for so in shop_orders if not so.shop.state), None)
         if bad_shop:
             return Response(
                 {
@@ -364,11 +302,14 @@ class CheckoutAPIView(APIView):
         if not need_map:
             return Response({"detail": "Корзина пуста."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Лочим ProductInfo и проверяем остатки, потом списываем
+        # Лочим ProductInfo и проверяем остатки, потом списываем.
+        # Строки берём в порядке id, чтобы параллельные оформления с общими товарами
+        # не ловили deadlock; no_key — не блокируем вставку OrderItem, ссылающихся на эти строки.
         product_infos = (
             ProductInfo.objects
-            .select_for_update()
-            .filter(id__in=list(need_map.keys()))
+            .select_for_update(of=("self",), no_key=True)
+            .filter(id__in=sorted(need_map))
+            .order_by("id")
         )
         pi_by_id = {pi.id: pi for pi in product_infos}
 
@@ -390,15 +331,23 @@ class CheckoutAPIView(APIView):
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
-        # списание
+        # списание (одним UPDATE, пока держим блокировки)
         for pi_id, need_qty in need_map.items():
-            pi = pi_by_id[pi_id]
-            pi.quantity -= need_qty
-            pi.save(update_fields=["quantity"])
-
-        # Меняем статусы заказа и подзаказов
+            pi_by_id[pi_id].quantity -= need_qty
+        ProductInfo.objects.bulk_update(list(pi_by_id.values()), ["quantity"], batch_size=500)
+        # bulk_update не шлёт post_save — остатки в каталоге сбрасываем сами
+        invalidate_catalog()
+
+        # Меняем статусы заказа и подзаказов.
+        # Агрегаты для списка заказов фиксируем здесь: подзаказы и позиции уже загружены, запросов не добавляется
+        items = [item for so in shop_orders for item in so.items.all()]
         basket.status = Order.Status.PLACED
-        basket.save(update_fields=["status"])
+        basket.total_cached = sum((item.line_total for item in items), Decimal("0"))
+        basket.items_count_cached = len(items)
+        basket.shops_count_cached = len(shop_orders)
+        basket.save(update_fields=[
+            "status", "total_cached", "items_count_cached", "shops_count_cached", "updated_at",
+        ])
 
         ShopOrder.objects.filter(order=basket).update(status=ShopOrder.Status.PROCESSING)
 
@@ -406,11 +355,9 @@ class CheckoutAPIView(APIView):
         new_basket = Order.objects.create(user=request.user, status=Order.Status.BASKET)
         _ensure_basket_has_address(new_basket)
 
-        # Письма
-        for so in basket.shop_orders.select_related("shop", "shop__user").prefetch_related("items__product_info__product"):
-            _send_shop_invoice(so)
-        _send_buyer_confirmation(basket)
-        _send_admin_invoice(basket)
+        # Письма собирает воркер по id заказа — после коммита, чтобы он увидел оформленный заказ
+        order_id = basket.id
+        transaction.on_commit(lambda: send_order_emails_task.delay(order_id))
 
         return Response({"success": True, "order_id": basket.id}, status=status.HTTP_200_OK)
 
@@ -442,4 +389,4 @@ class BasketSetAddressAPIView(APIView):
         addr = Address.objects.get(id=s.validated_data["address_id"], user=request.user)
         _apply_address_to_order(basket, addr)
 
-        return Response(BasketSerializer(basket).data, status=status.HTTP_200_OK)
+        return Response(_serialized_basket(basket), status=status.HTTP_200_OK)
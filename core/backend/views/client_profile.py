@@ -1,19 +1,27 @@
-from django.conf import settings
-from django.core.mail import send_mail
 from django.core.signing import TimestampSigner, BadSignature, SignatureExpired
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
-from django.db.models import Sum, F, Count
+from django.db.models import F
+from django.http import Http404
+from django.db.models.functions import Lower
 
-from django.contrib.auth import get_user_model
+from django.contrib.auth import get_user_model, update_session_auth_hash
+from django.contrib.auth.hashers import make_password
 from rest_framework.views import APIView
+from rest_framework.generics import RetrieveAPIView
+from rest_framework.exceptions import NotFound
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from rest_framework import status
-from django.db import transaction
-from drf_spectacular.utils import extend_schema, OpenApiResponse
+from rest_framework import status, serializers
+from django.db import transaction, IntegrityError
+from drf_spectacular.utils import extend_schema, OpenApiResponse, OpenApiParameter
+from drf_spectacular.types import OpenApiTypes
 
 from backend.models import Address, Order
+from backend.cache import invalidate_default_address, invalidate_user_tokens
+from backend.pagination import DefaultLimitOffsetPagination, paginated_schema
+from backend.tasks import send_email_task
+from utils import build_absolute
 
 from backend.serializers.client_profile import (
     ClientProfileSerializer,
@@ -29,23 +37,43 @@ User = get_user_model()
 signer = TimestampSigner()
 
 
-def _build_absolute(request, path: str) -> str:
-    return request.build_absolute_uri(path)
+def _set_default_address(user, target_id: int) -> None:
+    # Делает адрес target_id единственным default.
+    # Одним UPDATE c CASE тут не обойтись: частичный уникальный индекс
+    # uniq_default_address_per_user в PostgreSQL проверяется построчно,
+    # поэтому сначала снимаем флаг со старого default, потом ставим новый.
+    # Оба запроса трогают только строки, которые реально меняются.
+    Address.objects.filter(user=user, is_default=True).exclude(id=target_id).update(is_default=False)
+    Address.objects.filter(id=target_id, user=user, is_default=False).update(is_default=True)
 
 
-def _ensure_single_default_address(user):
-    # Если у пользователя есть адреса - ровно 1 дефолтный
-    qs = Address.objects.filter(user=user)
-    if not qs.exists():
-        return
+def _lock_user_addresses(user) -> None:
+    # Изменения адресов одного пользователя выполняем по очереди: блокируем строку пользователя.
+    # Блокировка строк Address не закрывает случай "адресов ещё нет" (два первых адреса сразу),
+    # а FOR NO KEY UPDATE не мешает вставкам со ссылкой на пользователя
+    list(User.objects.select_for_update(no_key=True).filter(pk=user.pk).values_list("pk", flat=True))
 
-    if qs.filter(is_default=True).count() == 1:
-        return
 
-    # если 0 или >1 — фиксируем: делаем дефолтным самый новый (макс id)
-    newest = qs.order_by("-id").first()
-    Address.objects.filter(user=user).update(is_default=False)
-    Address.objects.filter(id=newest.id).update(is_default=True)
+def _order_list_rows(rows) -> list[dict]:
+    # Строки values() уже имеют форму ClientOrderListSerializer — без сериализатора
+    # приводим только дату и сумму к тому же виду, что он отдавал
+    date_field = serializers.DateTimeField()
+    return [
+        {**row, "date": date_field.to_representation(row["date"]), "total": f"{row['total']:.2f}"}
+        for row in rows
+    ]
+
+
+def _profile_payload(user) -> dict:
+    # Те же поля, что у ClientProfileSerializer: все скалярные, request.user уже загружен
+    return {
+        "id": user.pk,
+        "email": user.email,
+        "username": user.username,
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+        "type": user.type,
+    }
 
 
 class ClientProfileAPIView(APIView):
@@ -60,7 +88,7 @@ class ClientProfileAPIView(APIView):
         },
     )
     def get(self, request):
-        return Response(ClientProfileSerializer(request.user).data)
+        return Response(_profile_payload(request.user))
 
     @extend_schema(
         summary="Обновить профиль текущего пользователя",
@@ -76,7 +104,7 @@ class ClientProfileAPIView(APIView):
         s = ClientProfileUpdateSerializer(instance=request.user, data=request.data, partial=True)
         s.is_valid(raise_exception=True)
         s.save()
-        return Response(ClientProfileSerializer(request.user).data, status=status.HTTP_200_OK)
+        return Response(_profile_payload(request.user), status=status.HTTP_200_OK)
 
 
 class ClientChangePasswordAPIView(APIView):
@@ -96,8 +124,12 @@ class ClientChangePasswordAPIView(APIView):
         s = ChangePasswordSerializer(data=request.data, context={"request": request})
         s.is_valid(raise_exception=True)
 
-        request.user.set_password(s.validated_data["new_password"])
-        request.user.save(update_fields=["password"])
+        # Точечный UPDATE без полного save(); кэш токенов и сессию обновляем явно
+        password = make_password(s.validated_data["new_password"])
+        User.objects.filter(pk=request.user.pk).update(password=password)
+        request.user.password = password
+        invalidate_user_tokens(request.user.pk)
+        update_session_auth_hash(request, request.user)
 
         return Response({"success": True}, status=status.HTTP_200_OK)
 
@@ -128,9 +160,10 @@ class ClientRequestEmailChangeAPIView(APIView):
         uidb64 = urlsafe_base64_encode(force_bytes(request.user.pk))
         signed = signer.sign(f"{uidb64}:{new_email}")  # timestamp inside signer
 
-        confirm_link = _build_absolute(request, f"/api/client/profile/email/confirm/{signed}/")
+        confirm_link = build_absolute(request, f"/api/client/profile/email/confirm/{signed}/")
 
-        send_mail(
+        # Подпись и ссылка готовы уже здесь; SMTP — забота воркера, ответ его не ждёт
+        send_email_task.delay(
             subject="Подтверждение смены email",
             message=(
                 "Привет!\n"
@@ -138,9 +171,7 @@ class ClientRequestEmailChangeAPIView(APIView):
                 f"{confirm_link}\n\n"
                 "Если это был не ты — просто игнорируй письмо."
             ),
-            from_email=settings.DEFAULT_FROM_EMAIL,
             recipient_list=[new_email],
-            fail_silently=False,
         )
 
         return Response({"success": True}, status=status.HTTP_200_OK)
@@ -183,12 +214,24 @@ class ClientConfirmEmailChangeAPIView(APIView):
 
         new_email = new_email.strip().lower()
 
-        # проверка уникальности
-        if User.objects.filter(email=new_email).exclude(id=request.user.id).exists():
+        # проверка уникальности без учёта регистра (попадает в индекс user_email_lower_uniq)
+        email_taken = (
+            User.objects
+            .annotate(email_lower=Lower("email"))
+            .filter(email_lower=new_email)
+            .exclude(pk=request.user.pk)
+            .exists()
+        )
+        if email_taken:
             return Response({"success": False, "message": "Этот email уже занят."}, status=status.HTTP_400_BAD_REQUEST)
 
+        # гонка между проверкой и сохранением ловится уникальным индексом
         request.user.email = new_email
-        request.user.save(update_fields=["email"])
+        try:
+            with transaction.atomic():
+                request.user.save(update_fields=["email"])
+        except IntegrityError:
+            return Response({"success": False, "message": "Этот email уже занят."}, status=status.HTTP_400_BAD_REQUEST)
         return Response({"success": True, "message": "Email обновлён."}, status=status.HTTP_200_OK)
 
 
@@ -204,8 +247,14 @@ class ClientAddressListCreateAPIView(APIView):
         },
     )
     def get(self, request):
-        qs = Address.objects.filter(user=request.user).order_by("-is_default", "-id")
-        return Response(AddressSerializer(qs, many=True).data)
+        # Берём только колонки, которые отдаёт AddressSerializer
+        qs = (
+            Address.objects.filter(user=request.user)
+            .only(*AddressSerializer.Meta.fields)
+            .order_by("-is_default", "-id")
+        )
+        # Связей сериализатор не читает, поэтому можно идти курсором без кэша queryset
+        return Response(AddressSerializer(qs.iterator(chunk_size=200), many=True).data)
 
     @extend_schema(
         summary="Создать адрес доставки",
@@ -224,29 +273,24 @@ class ClientAddressListCreateAPIView(APIView):
     )
     @transaction.atomic
     def post(self, request):
+        _lock_user_addresses(request.user)
         s = AddressCreateSerializer(data=request.data)
         s.is_valid(raise_exception=True)
 
         has_any = Address.objects.filter(user=request.user).exists()
-        want_default = bool(s.validated_data.get("is_default", False))
+        want_default = bool(s.validated_data.pop("is_default", False))
 
-        addr = Address.objects.create(user=request.user, **s.validated_data)
-
-        # правило: первый адрес всегда default
-        if not has_any:
-            Address.objects.filter(user=request.user).update(is_default=False)
-            Address.objects.filter(id=addr.id).update(is_default=True)
-
-        # если адрес не первый, но попросили default — делаем его единственным default
-        elif want_default:
-            Address.objects.filter(user=request.user).update(is_default=False)
-            Address.objects.filter(id=addr.id).update(is_default=True)
+        # правило: первый адрес всегда default;
+        # если адрес не первый, но попросили default — делаем его единственным default.
+        # Флаг считаем до INSERT: старый default снимаем заранее, чтобы не упереться в уникальный индекс
+        make_default = not has_any or want_default
+        if make_default and has_any:
+            Address.objects.filter(user=request.user, is_default=True).update(is_default=False)
 
         # если не попросили default — оставляем как есть (старый default остаётся)
+        addr = Address.objects.create(user=request.user, is_default=make_default, **s.validated_data)
+        invalidate_default_address(request.user.id)
 
-        _ensure_single_default_address(request.user)
-
-        addr.refresh_from_db()
         return Response(AddressSerializer(addr).data, status=status.HTTP_201_CREATED)
 
 
@@ -286,21 +330,28 @@ class ClientAddressDetailAPIView(APIView):
     )
     @transaction.atomic
     def patch(self, request, address_id):
+        _lock_user_addresses(request.user)
         addr = self.get_object(request, address_id)
         if not addr:
             return Response({"detail": "Адрес не найден."}, status=status.HTTP_404_NOT_FOUND)
 
         s = AddressUpdateSerializer(instance=addr, data=request.data, partial=True, context={"request": request})
         s.is_valid(raise_exception=True)
+
+        # Флаг default не пишем через save(): при живом старом default упрёмся в уникальный индекс.
+        # Снять default с дефолтного адреса сериализатор не даст, значит False ничего не меняет
+        make_default = s.validated_data.pop("is_default", None) is True
         updated = s.save()
 
         # если сделали default=True -> сбрасываем остальные
-        if request.data.get("is_default") is True or request.data.get("is_default") == "true":
-            Address.objects.filter(user=request.user).exclude(id=updated.id).update(is_default=False)
-            Address.objects.filter(id=updated.id).update(is_default=True)
-
-        _ensure_single_default_address(request.user)
-        updated.refresh_from_db()
+        if make_default:
+            _set_default_address(request.user, updated.id)
+            updated.is_default = True
+        # в кэше лежит сам адрес по умолчанию — правка его полей тоже делает запись устаревшей
+        if make_default or updated.is_default:
+            invalidate_default_address(request.user.id)
+
+        # Остальные поля в объекте уже актуальны после save — перечитывать строку не нужно
         return Response(AddressSerializer(updated).data, status=status.HTTP_200_OK)
 
     @extend_schema(
@@ -314,6 +365,7 @@ class ClientAddressDetailAPIView(APIView):
     )
     @transaction.atomic
     def delete(self, request, address_id):
+        _lock_user_addresses(request.user)
         addr = self.get_object(request, address_id)
         if not addr:
             return Response({"detail": "Адрес не найден."}, status=status.HTTP_404_NOT_FOUND)
@@ -321,8 +373,12 @@ class ClientAddressDetailAPIView(APIView):
         was_default = addr.is_default
         addr.delete()
 
+        # Под блокировкой других default быть не может — отдаём флаг самому новому из оставшихся
         if was_default:
-            _ensure_single_default_address(request.user)
+            Address.objects.filter(
+                id=Address.objects.filter(user=request.user).order_by("-id").values("id")[:1]
+            ).update(is_default=True)
+            invalidate_default_address(request.user.id)
 
         return Response(status=status.HTTP_204_NO_CONTENT)
 
@@ -341,68 +397,84 @@ class ClientAddressSetDefaultAPIView(APIView):
     )
     @transaction.atomic
     def post(self, request, address_id):
+        _lock_user_addresses(request.user)
         addr = Address.objects.filter(id=address_id, user=request.user).first()
         if not addr:
             return Response({"detail": "Адрес не найден."}, status=status.HTTP_404_NOT_FOUND)
 
-        Address.objects.filter(user=request.user).update(is_default=False)
-        Address.objects.filter(id=addr.id).update(is_default=True)
+        _set_default_address(request.user, addr.id)
+        invalidate_default_address(request.user.id)
 
-        addr.refresh_from_db()
+        addr.is_default = True
         return Response(AddressSerializer(addr).data, status=status.HTTP_200_OK)
 
 class ClientOrdersAPIView(APIView):
     permission_classes = [IsAuthenticated]
+    pagination_class = DefaultLimitOffsetPagination
 
     @extend_schema(
         summary="Список заказов пользователя",
-        description="Возвращает все заказы пользователя кроме корзины, с агрегатами total/shops_count/items_count.",
+        description=(
+                "Возвращает заказы пользователя кроме корзины, с агрегатами total/shops_count/items_count.\n\n"
+                "Пагинация limit/offset (по умолчанию 20 заказов)."
+        ),
+        parameters=[
+            OpenApiParameter(name="limit", type=OpenApiTypes.INT, location=OpenApiParameter.QUERY, required=False),
+            OpenApiParameter(name="offset", type=OpenApiTypes.INT, location=OpenApiParameter.QUERY, required=False),
+        ],
         responses={
-            200: ClientOrderListSerializer(many=True),
+            200: paginated_schema("PaginatedClientOrderList", ClientOrderListSerializer(many=True)),
             401: OpenApiResponse(description="Не авторизован"),
         },
     )
     def get(self, request):
 
+        # Агрегаты денормализованы в Order (фиксируются при оформлении заказа),
+        # поэтому никаких JOIN-ов и агрегаций на чтении
         qs = (
             Order.objects
             .filter(user=request.user)
             .exclude(status=Order.Status.BASKET)
-            .annotate(
-                total=Sum(F("shop_orders__items__quantity") * F("shop_orders__items__price_at_purchase")),
-                shops_count=Count("shop_orders", distinct=True),
-                items_count=Count("shop_orders__items", distinct=True),
-            )
             .order_by("-date")
+            .values(
+                "id",
+                "date",
+                "status",
+                total=F("total_cached"),
+                shops_count=F("shops_count_cached"),
+                items_count=F("items_count_cached"),
+            )
         )
-        return Response(ClientOrderListSerializer(qs, many=True).data, status=status.HTTP_200_OK)
-
-
-class ClientOrderDetailAPIView(APIView):
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(qs, request, view=self)
+        return paginator.get_paginated_response(_order_list_rows(page))
+
+
+@extend_schema(
+    summary="Деталка заказа пользователя",
+    description="Возвращает заказ (кроме корзины) со всеми подзаказами и позициями.",
+    responses={
+        200: ClientOrderDetailSerializer,
+        404: OpenApiResponse(description="Заказ не найден"),
+        401: OpenApiResponse(description="Не авторизован"),
+    },
+)
+class ClientOrderDetailAPIView(RetrieveAPIView):
     permission_classes = [IsAuthenticated]
+    serializer_class = ClientOrderDetailSerializer
+    lookup_field = "pk"
+    lookup_url_kwarg = "order_id"
 
-    @extend_schema(
-        summary="Деталка заказа пользователя",
-        description="Возвращает заказ (кроме корзины) со всеми подзаказами и позициями.",
-        responses={
-            200: ClientOrderDetailSerializer,
-            404: OpenApiResponse(description="Заказ не найден"),
-            401: OpenApiResponse(description="Не авторизован"),
-        },
-    )
-    def get(self, request, order_id: int):
-
-        order = (
+    def get_queryset(self):
+        return ClientOrderDetailSerializer.setup_eager_loading(
             Order.objects
-            .filter(id=order_id, user=request.user)
+            .filter(user=self.request.user)
             .exclude(status=Order.Status.BASKET)
-            .prefetch_related(
-                "shop_orders__shop",
-                "shop_orders__items__product_info__product",
-            )
-            .first()
         )
-        if not order:
-            return Response({"detail": "Заказ не найден."}, status=status.HTTP_404_NOT_FOUND)
 
-        return Response(ClientOrderDetailSerializer(order).data, status=status.HTTP_200_OK)
\ No newline at end of file
+    def get_object(self):
+        # Стандартный поиск DRF (с check_object_permissions), меняем только текст 404
+        try:
+            return super().get_object()
+        except Http404:
+            raise NotFound("Заказ не найден.")
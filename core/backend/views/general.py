@@ -1,16 +1,63 @@
-from django.db.models import Min, Max, Count
+from django.db.models import Min, Max, Count, Prefetch
 from rest_framework.generics import ListAPIView, RetrieveAPIView
 from rest_framework.permissions import AllowAny
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import OrderingFilter
+from rest_framework.response import Response
+from django.core.cache import cache
 
-from backend.models import Product, ProductInfo, Shop
+from backend.models import Product, ProductInfo, Shop, ProductParameter, Category
 from backend.serializers.general import ProductSerializer, ProductInfoCatalogSerializer, ShopPublicSerializer
 from backend.filters.general import ProductFilter, ProductInfoFilter
+from backend.cache import CATALOG_TTL, catalog_cache_key
 from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiResponse
 from drf_spectacular.types import OpenApiTypes
 
 
+class _CachedCatalogListMixin:
+    # Публичный список кэшируется целиком по полному URL (фильтры и сортировка входят в ключ)
+    def list(self, request, *args, **kwargs):
+        key = catalog_cache_key(request.get_full_path())
+        data = cache.get(key)
+        if data is None:
+            data = super().list(request, *args, **kwargs).data
+            cache.set(key, data, CATALOG_TTL)
+        return Response(data)
+
+
+# Колонки, которые реально нужны ProductInfoCatalogSerializer
+_CATALOG_OFFER_FIELDS = (
+    "id", "external_id", "quantity", "price", "price_rrc",
+    "shop__id", "shop__name", "shop__url",
+    "product__id", "product__name", "product__model", "product__description",
+    "product__category_id",
+)
+
+
+def _catalog_offers_queryset():
+    # Общая выборка витрины: только доступные офферы и только нужные колонки
+    return (
+        ProductInfo.objects
+        .select_related("shop", "product")
+        .only(*_CATALOG_OFFER_FIELDS)
+        .prefetch_related(
+            # Категорий мало, а офферов много: отдельный маленький запрос
+            # дешевле, чем тащить колонки категории в каждой строке JOIN
+            Prefetch("product__category", queryset=Category.objects.only("id", "name")),
+            Prefetch(
+                "parameters",
+                queryset=ProductParameter.objects
+                .select_related("parameter")
+                .only("id", "product_info_id", "value", "parameter__name")
+                # ordering модели тянет JOIN до product — внутри одного оффера он бесполезен
+                .order_by("id"),
+            )
+        )
+        .filter(quantity__gt=0)
+        .filter(shop__state=True)
+    )
+
+
 # Все продукты-эталоны
 @extend_schema(
     summary="Список продуктов (эталоны)",
@@ -26,7 +73,7 @@ from drf_spectacular.types import OpenApiTypes
         200: ProductSerializer(many=True),
     },
 )
-class ProductListAPIView(ListAPIView):
+class ProductListAPIView(_CachedCatalogListMixin, ListAPIView):
     permission_classes = [AllowAny]
     serializer_class = ProductSerializer
 
@@ -61,7 +108,7 @@ class ProductListAPIView(ListAPIView):
         200: ProductInfoCatalogSerializer(many=True),
     },
 )
-class CatalogOfferListAPIView(ListAPIView):
+class CatalogOfferListAPIView(_CachedCatalogListMixin, ListAPIView):
     permission_classes = [AllowAny]
     serializer_class = ProductInfoCatalogSerializer
 
@@ -73,13 +120,7 @@ class CatalogOfferListAPIView(ListAPIView):
     ordering = ["price"]
 
     def get_queryset(self):
-        return (
-            ProductInfo.objects
-            .select_related("shop", "product", "product__category")
-            .prefetch_related("parameters__parameter")
-            .filter(quantity__gt=0)
-            .filter(shop__state=True)
-        )
+        return _catalog_offers_queryset()
 
 # Публичный профиль магазина
 @extend_schema(
@@ -111,15 +152,8 @@ class ShopPublicDetailAPIView(RetrieveAPIView):
     lookup_url_kwarg = "shop_id"
 
     def get_queryset(self):
-        return (
-            Shop.objects
-            .prefetch_related("categories")
-            .annotate(
-                offers_count=Count("offers", distinct=True),
-                min_price=Min("offers__price"),
-                max_price=Max("offers__price"),
-            )
-        )
+        # offers_count/min_price/max_price хранятся в самом Shop (см. signals)
+        return Shop.objects.prefetch_related("categories")
 
 # Публичные товары/офферы конкретного магазина
 @extend_schema(
@@ -157,11 +191,4 @@ class ShopPublicOffersAPIView(ListAPIView):
 
     def get_queryset(self):
         shop_id = self.kwargs["shop_id"]
-        return (
-            ProductInfo.objects
-            .select_related("shop", "product", "product__category")
-            .prefetch_related("parameters__parameter")
-            .filter(shop_id=shop_id)
-            .filter(quantity__gt=0)
-            .filter(shop__state=True)
-        )
\ No newline at end of file
+        return _catalog_offers_queryset().filter(shop_id=shop_id)
\ No newline at end of file
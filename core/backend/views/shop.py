@@ -1,13 +1,17 @@
+from collections import defaultdict
+
+from django.core.cache import cache
 from django.core.validators import URLValidator
 from django.core.exceptions import ValidationError
 from django.db.models import Prefetch
+from django.http import HttpResponse, StreamingHttpResponse
 from rest_framework.exceptions import NotFound
 
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework import status
-from rest_framework.exceptions import PermissionDenied
 from drf_spectacular.utils import (
     extend_schema,
     OpenApiParameter,
@@ -17,10 +21,14 @@ from drf_spectacular.utils import (
 from drf_spectacular.types import OpenApiTypes
 from rest_framework import serializers
 
+from backend.cache import SHOP_PROFILE_TTL, shop_profile_key, get_shop_id as cached_shop_id
+from backend.permissions import IsShopOwner
+from backend.renderers import ORJSONRenderer, orjson_dumps
 from backend.throttles import ImportThrottle
+from backend.pagination import DefaultLimitOffsetPagination, paginated_schema
 
 from backend.tasks import import_shop_yaml_task
-from backend.models import Shop, ProductInfo, OrderItem, ShopOrder
+from backend.models import Shop, Order, ProductInfo, OrderItem, ShopOrder, ProductParameter
 from backend.serializers.shop import (
     ChangeShopInfoSerializer,
     ShopOrderSerializer,
@@ -29,16 +37,129 @@ from backend.serializers.shop import (
     ProductInfoReadSerializer
 )
 
+_URL_VALIDATOR = URLValidator()
 
-def check_rights(request):
-    if request.user.type != "shop":
-        raise PermissionDenied("Это действие доступно только владельцу магазина.")
-    return True
+# Постоянные ответы сериализуем один раз: без согласования формата и рендерера DRF на каждый запрос
+_IMPORT_ACCEPTED_BODY = orjson_dumps({
+    "success": True,
+    "message": "Импорт поставлен в очередь и будет выполнен асинхронно",
+})
 
-def get_shop(request) -> Shop:
-    shop = Shop.objects.filter(user=request.user).first()
-    if not shop:
+# Всё, кроме корзины
+_PLACED_ORDER_STATUSES = [s for s in Order.Status.values if s != Order.Status.BASKET]
+_PLACED_SHOP_ORDER_STATUSES = [s for s in ShopOrder.Status.values if s != ShopOrder.Status.BASKET]
+
+# Колонки, которые реально читает ProductInfoReadSerializer (деталка и выгрузка) — остальное не тянем из БД
+_SHOP_OFFER_FIELDS = (
+    "id", "external_id", "quantity", "price", "price_rrc", "product_id",
+    "product__id", "product__name", "product__model", "product__category_id",
+    "product__category__id", "product__category__name",
+)
+
+
+def _stream_offers(qs):
+    # JSON-массив по кусочкам; prefetch параметров работает внутри каждого chunk
+    yield "["
+    first = True
+    for pi in qs.iterator(chunk_size=2000):
+        if not first:
+            yield ","
+        first = False
+        yield orjson_dumps(ProductInfoReadSerializer(pi).data)
+    yield "]"
+
+
+def _shop_order_rows(rows) -> list[dict]:
+    # Та же форма, что у ShopOrderSerializer, но из values(): без моделей и get_attribute на каждое поле
+    rows = list(rows)
+    items = defaultdict(list)
+    item_rows = (
+        OrderItem.objects
+        .filter(shop_order_id__in=[row["id"] for row in rows])
+        .order_by("id")
+        .values(
+            "id", "shop_order_id", "quantity", "price_at_purchase",
+            "product_info__product_id", "product_info__product__name", "product_info__product__model",
+        )
+    )
+    for item in item_rows:
+        items[item["shop_order_id"]].append({
+            "id": item["id"],
+            "product_id": item["product_info__product_id"],
+            "product_name": item["product_info__product__name"],
+            "product_model": item["product_info__product__model"],
+            "quantity": item["quantity"],
+            "price_at_purchase": f"{item['price_at_purchase']:.2f}",
+        })
+
+    date_field = serializers.DateTimeField()
+    return [
+        {
+            "id": row["id"],
+            "order_id": row["order_id"],
+            "date": date_field.to_representation(row["order__date"]),
+            "order_status": row["order__status"],
+            "status": row["status"],
+            "shipping_country": row["order__shipping_country"],
+            "shipping_city": row["order__shipping_city"],
+            "shipping_street": row["order__shipping_street"],
+            "shipping_house": row["order__shipping_house"],
+            "shipping_apartment": row["order__shipping_apartment"],
+            "items": items[row["id"]],
+        }
+        for row in rows
+    ]
+
+
+def _offer_rows(rows) -> list[dict]:
+    # Та же форма, что у ProductInfoReadSerializer, но из values()
+    rows = list(rows)
+    params = defaultdict(list)
+    param_rows = (
+        ProductParameter.objects
+        .filter(product_info_id__in=[row["id"] for row in rows])
+        .order_by("id")
+        .values("product_info_id", "parameter__name", "value")
+    )
+    for pp in param_rows:
+        params[pp["product_info_id"]].append({"name": pp["parameter__name"], "value": pp["value"]})
+
+    return [
+        {
+            "id": row["id"],
+            "external_id": row["external_id"],
+            "quantity": row["quantity"],
+            "price": f"{row['price']:.2f}",
+            "price_rrc": f"{row['price_rrc']:.2f}",
+            "product_id": row["product_id"],
+            "product_name": row["product__name"],
+            "product_model": row["product__model"],
+            "category_id": row["product__category_id"],
+            "category_name": row["product__category__name"],
+            "parameters": params[row["id"]],
+        }
+        for row in rows
+    ]
+
+
+def get_shop_id(request) -> int:
+    # Для эндпоинтов, которым нужен только id магазина: на тёплом кэше — ни одного запроса к БД
+    shop_id = cached_shop_id(request.user.id)
+    if shop_id is None:
         raise NotFound("Shop not found")
+    return shop_id
+
+
+def get_shop(request) -> Shop:
+    # Тип пользователя уже проверен IsShopOwner; request.user в пределах запроса
+    # не меняется — магазин ищем не больше одного раза
+    shop = getattr(request, "_cached_shop", None)
+    if shop is None:
+        # агрегаты *_cached эндпоинтам продавца не нужны
+        shop = Shop.objects.only("id", "user_id", "name", "url", "state").filter(user=request.user).first()
+        if not shop:
+            raise NotFound("Shop not found")
+        request._cached_shop = shop
     return shop
 
 
@@ -71,12 +192,11 @@ def get_shop(request) -> Shop:
     },
 )
 class ImportShopInfoAPIView(APIView):
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated, IsShopOwner]
     throttle_classes = [ImportThrottle]
 
     def post(self, request, *args, **kwargs):
-        check_rights(request)
-        shop = get_shop(request)
+        shop_id = get_shop_id(request)
 
         url = request.data.get("url")
         if not url:
@@ -86,7 +206,7 @@ class ImportShopInfoAPIView(APIView):
             )
 
         try:
-            URLValidator()(url)
+            _URL_VALIDATOR(url)
         except ValidationError as e:
             return Response(
                 {"success": False, "error": e.message},
@@ -94,15 +214,9 @@ class ImportShopInfoAPIView(APIView):
             )
 
         # Логика перенесена в таск
-        import_shop_yaml_task.delay(shop.id, url)
+        import_shop_yaml_task.delay(shop_id, url)
 
-        return Response(
-            {
-                "success": True,
-                "message": "Импорт поставлен в очередь и будет выполнен асинхронно",
-            },
-            status=status.HTTP_202_ACCEPTED,
-        )
+        return HttpResponse(_IMPORT_ACCEPTED_BODY, status=status.HTTP_202_ACCEPTED, content_type="application/json")
 
 @extend_schema(
     summary="Заказы магазина (список или деталка по order_id)",
@@ -110,7 +224,9 @@ class ImportShopInfoAPIView(APIView):
         "Возвращает подзаказы (ShopOrder) текущего магазина.\n\n"
         "- Исключает корзины (order.status='basket' и ShopOrder.status='basket').\n"
         "- Если передан `order_id` в URL — вернёт только подзаказ(ы) для этого заказа.\n"
-        "- В ответе: адрес доставки, статус заказа/подзаказа, позиции."
+        "- В ответе: адрес доставки, статус заказа/подзаказа, позиции.\n\n"
+        "Список без `order_id` пагинируется limit/offset (по умолчанию 20 подзаказов);\n"
+        "с `order_id` возвращается обычный массив подзаказов без обёртки."
     ),
     parameters=[
         OpenApiParameter(
@@ -119,43 +235,46 @@ class ImportShopInfoAPIView(APIView):
             location=OpenApiParameter.PATH,
             required=False,
             description="ID заказа (если эндпоинт поддерживает /orders/<order_id>/)",
-        )
+        ),
+        OpenApiParameter(name="limit", type=OpenApiTypes.INT, location=OpenApiParameter.QUERY, required=False),
+        OpenApiParameter(name="offset", type=OpenApiTypes.INT, location=OpenApiParameter.QUERY, required=False),
     ],
     responses={
-        200: ShopOrderSerializer(many=True),
+        200: paginated_schema("PaginatedShopOrderList", ShopOrderSerializer(many=True)),
         403: OpenApiResponse(description="Доступно только владельцу магазина"),
         404: OpenApiResponse(description="Магазин не найден"),
     },
 )
 class GetOrdersAPIView(APIView):
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated, IsShopOwner]
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
+    pagination_class = DefaultLimitOffsetPagination
 
     def get(self, request, order_id=None, *args, **kwargs):
-        check_rights(request)
-
-        shop = get_shop(request)
-
-        items_qs = (
-            OrderItem.objects
-            .select_related("product_info__product")
-            .order_by("id")
-        )
+        shop_id = get_shop_id(request)
 
+        # Только чтение: строки values() без моделей, позиции — вторым запросом (см. _shop_order_rows)
         qs = (
             ShopOrder.objects
-            .filter(shop=shop)
-            .select_related("order")
-            .exclude(order__status="basket")
-            .exclude(status=ShopOrder.Status.BASKET)
-            .prefetch_related(Prefetch("items", queryset=items_qs))
-            .order_by("-order__date")
+            .filter(shop_id=shop_id)
+            # положительные IN вместо двух NOT (...): планировщик может взять их в индексный диапазон
+            .filter(order__status__in=_PLACED_ORDER_STATUSES, status__in=_PLACED_SHOP_ORDER_STATUSES)
+            .order_by("-order__date", "-id")
+            .values(
+                "id", "order_id", "status",
+                "order__date", "order__status",
+                "order__shipping_country", "order__shipping_city", "order__shipping_street",
+                "order__shipping_house", "order__shipping_apartment",
+            )
         )
 
         if order_id:
             qs = qs.filter(order_id=order_id)
+            return Response(_shop_order_rows(qs), status=status.HTTP_200_OK)
 
-        serializer = ShopOrderSerializer(qs, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(qs, request, view=self)
+        return paginator.get_paginated_response(_shop_order_rows(page))
 
 @extend_schema(
     summary="Сменить статус подзаказа магазина",
@@ -187,33 +306,49 @@ class GetOrdersAPIView(APIView):
         400: OpenApiResponse(description="Некорректный переход статуса / order_id не передан"),
         403: OpenApiResponse(description="Доступно только владельцу магазина"),
         404: OpenApiResponse(description="Заказ/подзаказ не найден"),
+        409: OpenApiResponse(description="Статус подзаказа изменён параллельным запросом"),
     },
 )
 class ChangeOrderStatusAPIView(APIView):
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated, IsShopOwner]
 
     def patch(self, request, order_id=None, *args, **kwargs):
-        check_rights(request)
-
-        shop = get_shop(request)
-
         if not order_id:
             return Response({"detail": "order_id is required"}, status=status.HTTP_400_BAD_REQUEST)
 
-        shop_order = ShopOrder.objects.filter(order_id=order_id, shop=shop).first()
+        # Принадлежность магазину проверяется JOIN-ом в том же запросе, отдельный get_shop не нужен
+        shop_order = (
+            ShopOrder.objects
+            .filter(order_id=order_id, shop__user=request.user)
+            .only("id", "status")
+            .first()
+        )
         if not shop_order:
             return Response({"detail": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
         serializer = ChangeShopOrderStatusSerializer(data=request.data, context={"shop_order": shop_order})
         serializer.is_valid(raise_exception=True)
 
-        shop_order.status = serializer.validated_data["status"]
-        shop_order.save(update_fields=["status"])
+        # Статус не влияет на агрегаты заказа, поэтому сигнал пересчёта здесь не нужен — один UPDATE.
+        # Переход проверялся от прочитанного статуса: если его успели сменить, UPDATE ничего не тронет
+        new_status = serializer.validated_data["status"]
+        updated = (
+            ShopOrder.objects
+            .filter(pk=shop_order.pk, status=shop_order.status)
+            .update(status=new_status)
+        )
+        if not updated:
+            return Response(
+                {"detail": "Статус подзаказа уже изменён, повторите запрос."},
+                status=status.HTTP_409_CONFLICT,
+            )
+        shop_order.status = new_status
 
         return Response({"success": True, "status": shop_order.status}, status=status.HTTP_200_OK)
 
 
 class ChangeShopInfoAPIView(APIView):
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated, IsShopOwner]
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
 
     @extend_schema(
         summary="Обновить профиль магазина",
@@ -239,7 +374,6 @@ class ChangeShopInfoAPIView(APIView):
         },
     )
     def patch(self, request, *args, **kwargs):
-        check_rights(request)
         shop = get_shop(request)
 
         serializer = ChangeShopInfoSerializer(instance=shop, data=request.data, partial=True)
@@ -266,25 +400,34 @@ class ChangeShopInfoAPIView(APIView):
         },
     )
     def get(self, request, *args, **kwargs):
-        check_rights(request)
-        shop = get_shop(request)
+        # профиль меняется редко — сериализованный ответ держим в кэше,
+        # сбрасывается сигналами Shop/Category (см. invalidate_shop_profiles)
+        key = shop_profile_key(get_shop_id(request))
+        shop_data = cache.get(key)
+        if shop_data is None:
+            shop_data = ShopFullSerializer(get_shop(request)).data
+            cache.set(key, shop_data, SHOP_PROFILE_TTL)
 
         return Response(
-            {"success": True, "shop_data": ShopFullSerializer(shop).data},
+            {"success": True, "shop_data": shop_data},
             status=status.HTTP_200_OK,
         )
 
 
 class ProductInfoAPIView(APIView):
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated, IsShopOwner]
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
+    pagination_class = DefaultLimitOffsetPagination
 
     @extend_schema(
         summary="Офферы магазина (список или деталка)",
         description=(
                 "Возвращает офферы (ProductInfo) текущего магазина.\n\n"
                 "- Без `pk` в URL → список.\n"
-                "- С `pk` → деталка конкретного оффера.\n\n"
-                "Подтягивает product/category и параметры."
+                "- С `pk` → деталка конкретного оффера (один объект, без обёртки).\n\n"
+                "Подтягивает product/category и параметры.\n"
+                "Список пагинируется limit/offset (по умолчанию 20 офферов).\n"
+                "С `?stream=1` — полная выгрузка одним потоковым JSON-массивом без пагинации."
         ),
         parameters=[
             OpenApiParameter(
@@ -293,23 +436,41 @@ class ProductInfoAPIView(APIView):
                 location=OpenApiParameter.PATH,
                 required=False,
                 description="ID оффера (если эндпоинт /products/<pk>/)",
-            )
+            ),
+            OpenApiParameter(name="limit", type=OpenApiTypes.INT, location=OpenApiParameter.QUERY, required=False),
+            OpenApiParameter(name="offset", type=OpenApiTypes.INT, location=OpenApiParameter.QUERY, required=False),
+            OpenApiParameter(
+                name="stream",
+                type=OpenApiTypes.INT,
+                location=OpenApiParameter.QUERY,
+                required=False,
+                description="1 — потоковая выгрузка всех офферов",
+            ),
         ],
         responses={
-            200: ProductInfoReadSerializer(many=True),
+            200: paginated_schema("PaginatedShopOfferList", ProductInfoReadSerializer(many=True)),
             404: OpenApiResponse(description="Оффер не найден"),
             403: OpenApiResponse(description="Доступно только владельцу магазина"),
         },
     )
     def get(self, request, pk=None, *args, **kwargs):
-        check_rights(request)
-        shop = get_shop(request)
+        shop_id = get_shop_id(request)
 
         qs = (
             ProductInfo.objects
-            .filter(shop=shop)
+            .filter(shop_id=shop_id)
             .select_related("product", "product__category")
-            .prefetch_related("parameters__parameter")
+            .only(*_SHOP_OFFER_FIELDS)
+            .prefetch_related(
+                Prefetch(
+                    "parameters",
+                    queryset=ProductParameter.objects
+                    .select_related("parameter")
+                    .only("id", "product_info_id", "value", "parameter__name")
+                    # ordering модели тянет JOIN до product — внутри одного оффера он бесполезен
+                    .order_by("id"),
+                )
+            )
             .order_by("-id")
         )
 
@@ -320,8 +481,23 @@ class ProductInfoAPIView(APIView):
                 return Response({"detail": "ProductInfo not found"}, status=status.HTTP_404_NOT_FOUND)
             return Response(ProductInfoReadSerializer(obj).data, status=status.HTTP_200_OK)
 
-        # список
-        return Response(ProductInfoReadSerializer(qs, many=True).data, status=status.HTTP_200_OK)
+        # полная выгрузка: строки отдаются по мере чтения курсора, без материализации всего списка
+        if request.query_params.get("stream") == "1":
+            return StreamingHttpResponse(_stream_offers(qs), content_type="application/json")
+
+        # список: строки values() без моделей, параметры — вторым запросом (см. _offer_rows)
+        rows = (
+            ProductInfo.objects
+            .filter(shop_id=shop_id)
+            .order_by("-id")
+            .values(
+                "id", "external_id", "quantity", "price", "price_rrc", "product_id",
+                "product__name", "product__model", "product__category_id", "product__category__name",
+            )
+        )
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(rows, request, view=self)
+        return paginator.get_paginated_response(_offer_rows(page))
 
     # Создание нового ProductInfo (и, возможно, Product)
     # Ожидаем данные:
@@ -355,7 +531,6 @@ class ProductInfoAPIView(APIView):
         },
     )
     def post(self, request, *args, **kwargs):
-        check_rights(request)
         shop = get_shop(request)
 
         serializer = ProductInfoCreateSerializer(
@@ -391,15 +566,15 @@ class ProductInfoAPIView(APIView):
         },
     )
     def delete(self, request, pk, *args, **kwargs):
-        check_rights(request)
-        shop = get_shop(request)
+        shop_id = get_shop_id(request)
 
-        product_info = ProductInfo.objects.filter(id=pk, shop=shop).first()
+        # для удаления (и сигналов агрегатов магазина) нужны только pk и shop_id
+        product_info = ProductInfo.objects.filter(id=pk, shop_id=shop_id).only("id", "shop_id").first()
         if not product_info:
             return Response({"detail": "ProductInfo not found"}, status=status.HTTP_404_NOT_FOUND)
 
         product_info.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        return HttpResponse(status=status.HTTP_204_NO_CONTENT)
 
     # Изменение старого ProductInfo
     @extend_schema(
@@ -429,10 +604,15 @@ class ProductInfoAPIView(APIView):
         },
     )
     def patch(self, request, pk, *args, **kwargs):
-        check_rights(request)
-        shop = get_shop(request)
+        shop_id = get_shop_id(request)
 
-        product_info = ProductInfo.objects.filter(id=pk, shop=shop).first()
+        # сериализатор меняет только количество/цены (save с update_fields) и параметры по pk оффера
+        product_info = (
+            ProductInfo.objects
+            .filter(id=pk, shop_id=shop_id)
+            .only("id", "shop_id", "quantity", "price", "price_rrc")
+            .first()
+        )
         if not product_info:
             return Response({"detail": "ProductInfo not found"}, status=status.HTTP_404_NOT_FOUND)
 
@@ -440,7 +620,6 @@ class ProductInfoAPIView(APIView):
             instance=product_info,
             data=request.data,
             partial=True,
-            context={"shop": shop},
         )
         serializer.is_valid(raise_exception=True)
         product_info = serializer.save()
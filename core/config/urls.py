@@ -1,5 +1,8 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
+from django.utils.cache import add_never_cache_headers
+from django.views.decorators.cache import cache_page
 
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 
@@ -17,12 +20,40 @@ from backend.views.shop import ImportShopInfoAPIView, GetOrdersAPIView, \
     ChangeOrderStatusAPIView, ChangeShopInfoAPIView, ProductInfoAPIView
 from backend.views.social_auth import GoogleLogin
 
+# Схема строится обходом всех view/сериализаторов — считаем её один раз на релиз.
+# Кэш только серверный: клиентам отдаём no-cache, иначе браузер/прокси держит старую схему сутки
+SCHEMA_CACHE_TTL = 60 * 60 * 24
+
+
+def _schema_cache(view):
+    cached_view = cache_page(SCHEMA_CACHE_TTL, key_prefix=f"schema:{settings.SCHEMA_VERSION}")(view)
+
+    def no_client_cache(response):
+        response.headers.pop("Expires", None)
+        add_never_cache_headers(response)
+        return response
+
+    def wrapped(request, *args, **kwargs):
+        response = cached_view(request, *args, **kwargs)
+        if getattr(response, "is_rendered", True):
+            return no_client_cache(response)
+        # cache_page кладёт ответ в кэш из post-render колбэка; no-cache ставим после него,
+        # иначе из-за private ответ не закэшируется вовсе
+        response.add_post_render_callback(no_client_cache)
+        return response
+
+    return wrapped
+
+# Одна view-функция на класс, смонтированный по двум адресам (список и деталка)
+_shop_products_view = ProductInfoAPIView.as_view()
+_shop_orders_view = GetOrdersAPIView.as_view()
+
 urlpatterns = [
     path("admin/", admin.site.urls),
 
     # OpenAPI schema + Swagger
-    path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
-    path("api/docs/", SpectacularSwaggerView.as_view(url_name="schema"), name="swagger-ui"),
+    path("api/schema/", _schema_cache(SpectacularAPIView.as_view()), name="schema"),
+    path("api/docs/", _schema_cache(SpectacularSwaggerView.as_view(url_name="schema")), name="swagger-ui"),
 
     # AUTH
     path("api/auth/login/", AuthAPIView.as_view(), name="auth-login"),
@@ -39,10 +70,10 @@ urlpatterns = [
     # SHOP (owner)
     path("api/shop/me/", ChangeShopInfoAPIView.as_view(), name="shop-me"),
     path("api/shop/me/import/", ImportShopInfoAPIView.as_view(), name="shop-import"),
-    path("api/shop/me/products/", ProductInfoAPIView.as_view(), name="shop-products"),
-    path("api/shop/me/products/<int:pk>/", ProductInfoAPIView.as_view(), name="shop-product-detail"),
-    path("api/shop/me/orders/", GetOrdersAPIView.as_view(), name="shop-orders"),
-    path("api/shop/me/orders/<int:order_id>/", GetOrdersAPIView.as_view(), name="shop-order-detail"),
+    path("api/shop/me/products/", _shop_products_view, name="shop-products"),
+    path("api/shop/me/products/<int:pk>/", _shop_products_view, name="shop-product-detail"),
+    path("api/shop/me/orders/", _shop_orders_view, name="shop-orders"),
+    path("api/shop/me/orders/<int:order_id>/", _shop_orders_view, name="shop-order-detail"),
     path("api/shop/me/orders/<int:order_id>/status/", ChangeOrderStatusAPIView.as_view(), name="shop-order-status"),
 
     # CATALOG (public)
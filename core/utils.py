@@ -1,7 +1,21 @@
+from django.conf import settings
 from django.contrib.auth.tokens import default_token_generator
 from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_encode
 
+
+def build_absolute(request, path: str) -> str:
+    """
+    Абсолютная ссылка для писем.
+
+    Если задан PUBLIC_ORIGIN (фиксированный адрес в проде) — просто склеиваем строку,
+    иначе собираем из заголовков запроса (удобно локально).
+    """
+    if settings.PUBLIC_ORIGIN:
+        return f"{settings.PUBLIC_ORIGIN}{path}"
+    return request.build_absolute_uri(path)
+
+
 def make_activation_link(request, user) -> str:
     """
     Генерирует абсолютную ссылку на активацию аккаунта.
@@ -12,4 +26,4 @@ def make_activation_link(request, user) -> str:
     uidb64 = urlsafe_base64_encode(force_bytes(user.pk))
     token = default_token_generator.make_token(user)
 
-    return request.build_absolute_uri(f"/api/auth/activate/{uidb64}/{token}/")
\ No newline at end of file
+    return build_absolute(request, f"/api/auth/activate/{uidb64}/{token}/")